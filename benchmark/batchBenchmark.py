@@ -0,0 +1,308 @@
+#!/usr/bin/python3
+"""
+This script benchmarks the batch pipeline shared by the gamess and Smina
+scripts. The programs are replaced by the stub executables in stubs/, which
+sleep, use the CPU and write synthetic logs of a set size, so the time spent
+scheduling, staging, harvesting and parsing can be measured on its own.
+
+JOBS jobs are run on CORES processors in a temporary directory. The report
+gives jobs per hour, latency percentiles of each pipeline stage and the
+peak RSS of the batch process and of its largest job. Each run is appended
+to BENCHMARK_RESULTS as one JSON line so runs can be compared.
+
+The stages are those recorded by batchMetrics: stage, wait, execute and
+harvest for every job, and cleanup, staging, spawn and parse where the
+backend has them.
+
+The ladder backend runs gamess steps the way optimizeBatchRun runs a basis set
+ladder: LADDER_MOLECULES molecules, each step queued when the molecule's
+previous step finishes. Steps of different molecules must run side by side;
+the benchmark fails when any step of the ladders did not overlap with the
+same step of the other molecules.
+
+To run this script:
+python3 batchBenchmark.py [gamess|smina|ladder] [jobs] [cores]
+"""
+
+import json
+import logging
+import os
+import resource
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             os.pardir, "common"))
+from asyncRunner import available_cores, run_batch
+from batchLog import start_batch_log
+from batchMetrics import job_timings, timed
+from gamessJob import GamessRunner
+from gamessLog import parse_log
+from sminaJob import SminaRunner
+
+# Constants that should be edited based on your system
+BACKEND = "gamess"  # "gamess" or "smina"
+JOBS = 20  # Number of jobs in the benchmark batch
+CORES = 4  # Processors given to the batch
+MIN_PROCESSORS_PER_JOB = 1  # Smallest processor count given to a job
+MONITOR_INTERVAL = 1  # Seconds between reads of a running job's log
+STUB_SLEEP_SECONDS = 0.5  # Time each stub job sleeps
+STUB_CPU_SECONDS = 0  # CPU time each stub job uses
+STUB_LOG_BYTES = 1024 ** 2  # Size of each gamess log (100 * 1024 ** 2 for large optimizations)
+ATOMS = 12  # Atoms in each generated gamess input
+LADDER_MOLECULES = 2  # Molecules stepped side by side by the ladder backend
+SCRATCH_ROOT = ""  # Private per-job scratch root for gamess jobs ("" to share)
+BENCHMARK_DIR = ""  # Directory for the benchmark files ("" for a temporary one)
+BENCHMARK_RESULTS = "benchmark_results.jsonl"  # Results of each run ("" to disable)
+
+STUBS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "stubs")
+
+
+def percentile(values, fraction):
+    # Nearest-rank percentile of a non-empty list
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1,
+                       int(round(fraction * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+
+def write_gamess_inputs(directory, jobs, atoms):
+    # Optimization inputs of chains of carbon atoms
+    input_files = []
+    for job in range(jobs):
+        input_file = "bench{:04d}Input.inp".format(job)
+        with open(os.path.join(directory, input_file), 'w') as gamess_input:
+            gamess_input.write(" $CONTRL SCFTYP=RHF RUNTYP=OPTIMIZE "
+                               "DFTTYP=B3LYP $END\n"
+                               " $BASIS GBASIS=N31 NGAUSS=6 $END\n"
+                               " $DATA\nBenchmark {}\nC1\n".format(job))
+            for atom in range(atoms):
+                gamess_input.write("C 6.0 0.0 0.0 {:.2f}\n".format(1.54 * atom))
+            gamess_input.write(" $END\n")
+        input_files.append(input_file)
+    return input_files
+
+
+def write_smina_inputs(directory, jobs):
+    test_compounds = []
+    for job in range(jobs):
+        test_compound = os.path.join(directory,
+                                     "compound_{:04d}.sdf".format(job))
+        with open(test_compound, 'w') as compound_file:
+            compound_file.write("compound_{:04d}\n\n\nM  END\n$$$$\n"
+                                .format(job))
+        test_compounds.append(test_compound)
+    return test_compounds
+
+
+def gamess_runner(benchmark_dir):
+    # GamessRunner of the stub rungms and the directory of its inputs
+    gamess_dir = os.path.join(benchmark_dir, "gamess")
+    data_dir = os.path.join(benchmark_dir, "data")
+    for directory in (gamess_dir, data_dir,
+                      os.path.join(benchmark_dir, "bin"),
+                      os.path.join(benchmark_dir, "scr")):
+        os.makedirs(directory, exist_ok=True)
+    shutil.copy(os.path.join(STUBS_DIR, "rungms"), gamess_dir)
+    runner = GamessRunner(gamess_dir, os.path.join(benchmark_dir, "bin"),
+                          os.path.join(benchmark_dir, "scr"), "00",
+                          scratch_root=SCRATCH_ROOT)
+    return runner, data_dir
+
+
+def run_gamess(benchmark_dir, jobs, cores):
+    runner, data_dir = gamess_runner(benchmark_dir)
+    queue = write_gamess_inputs(data_dir, jobs, ATOMS)
+    finished = []
+
+    def on_complete(job):
+        # Parsed as optimizeBatchRun does with every finished step
+        with timed(job["timings"], "parse"):
+            parse_log(os.path.join(job["input_directory"], job["output_name"]))
+        finished.append(job)
+
+    # Jobs take their inputs from the working directory
+    working_directory = os.getcwd()
+    os.chdir(data_dir)
+    try:
+        run_batch(runner, queue, cores, MIN_PROCESSORS_PER_JOB,
+                  MONITOR_INTERVAL, on_complete)
+    finally:
+        os.chdir(working_directory)
+        runner.close()
+    return finished
+
+
+def run_ladder(benchmark_dir, jobs, cores):
+    # jobs steps split between LADDER_MOLECULES ladders
+    runner, data_dir = gamess_runner(benchmark_dir)
+    queue = write_gamess_inputs(data_dir, LADDER_MOLECULES, ATOMS)
+    steps = max(1, jobs // LADDER_MOLECULES)
+    ladder_steps = {input_file: (molecule, 0)
+                    for molecule, input_file in enumerate(queue)}
+    finished = []
+
+    def on_complete(job):
+        with timed(job["timings"], "parse"):
+            parse_log(os.path.join(job["input_directory"], job["output_name"]))
+        finished.append(job)
+
+        # The molecule's next step is queued once this one is harvested
+        molecule, step = ladder_steps[job["input_file"]]
+        if step + 1 < steps:
+            next_input = "bench{:04d}Step{:02d}Input.inp".format(molecule,
+                                                                 step + 1)
+            shutil.copy(job["input_file"], next_input)
+            ladder_steps[next_input] = (molecule, step + 1)
+            queue.append(next_input)
+
+    working_directory = os.getcwd()
+    os.chdir(data_dir)
+    try:
+        run_batch(runner, queue, cores, MIN_PROCESSORS_PER_JOB,
+                  MONITOR_INTERVAL, on_complete)
+    finally:
+        os.chdir(working_directory)
+        runner.close()
+    for job in finished:
+        job["ladder_step"] = ladder_steps[job["input_file"]][1]
+    return finished
+
+
+def ladder_overlap(finished):
+    # Returns the number of ladder steps and the number of them whose jobs,
+    # one per molecule, all ran at the same time
+    step_times = {}
+    for job in finished:
+        step_times.setdefault(job["ladder_step"], []).append(
+            (job["times"]["started"], job["times"]["exited"]))
+    overlapping = sum(1 for times in step_times.values()
+                      if max(started for started, exited in times)
+                      < min(exited for started, exited in times))
+    return len(step_times), overlapping
+
+
+def run_smina(benchmark_dir, jobs, cores):
+    output_dir = os.path.join(benchmark_dir, "output")
+    os.makedirs(output_dir, exist_ok=True)
+    shutil.copy(os.path.join(STUBS_DIR, "smina.static"), benchmark_dir)
+    for name in ("REC.pdb", "LIG.sdf"):
+        open(os.path.join(benchmark_dir, name), 'w').close()
+    test_compounds = write_smina_inputs(benchmark_dir, jobs)
+
+    # Jobs are pinned, so processors beyond this machine's are shared
+    machine_cores = available_cores()
+    core_budget = [machine_cores[core % len(machine_cores)]
+                   for core in range(cores)]
+    runner = SminaRunner("smina.static", "REC.pdb", "LIG.sdf", output_dir)
+    finished = []
+
+    def on_complete(job):
+        finished.append(job)
+
+    # The Smina executable is run from the working directory
+    working_directory = os.getcwd()
+    os.chdir(benchmark_dir)
+    try:
+        run_batch(runner, test_compounds, core_budget,
+                  MIN_PROCESSORS_PER_JOB, MONITOR_INTERVAL, on_complete)
+    finally:
+        os.chdir(working_directory)
+    return finished
+
+
+def report(backend, jobs, cores, finished, wall_time):
+    # Logs the results of a run and returns them
+    results = {"backend": backend,
+               "jobs": jobs,
+               "cores": cores,
+               "stub_sleep_seconds": STUB_SLEEP_SECONDS,
+               "stub_cpu_seconds": STUB_CPU_SECONDS,
+               "stub_log_bytes": STUB_LOG_BYTES if backend != "smina" else 0,
+               "wall_time": wall_time,
+               "jobs_per_hour": len(finished) * 60 * 60 / wall_time,
+               "failed_jobs": sum(1 for job in finished if job["exit_status"]),
+               # ru_maxrss is in kB on Linux
+               "peak_rss_kb": resource.getrusage(
+                   resource.RUSAGE_SELF).ru_maxrss,
+               "peak_job_rss_kb": resource.getrusage(
+                   resource.RUSAGE_CHILDREN).ru_maxrss}
+
+    latencies = {}
+    for job in finished:
+        for stage, seconds in job_timings(job).items():
+            latencies.setdefault(stage, []).append(seconds)
+
+    logging.info("{} {} jobs on {} processors in {:.2f} s: {:.0f} jobs per hour, "
+                 "{} failed.".format(len(finished), backend, cores, wall_time,
+                                     results["jobs_per_hour"],
+                                     results["failed_jobs"]))
+    logging.info("Peak RSS: batch {} kB, largest job {} kB."
+                 .format(results["peak_rss_kb"], results["peak_job_rss_kb"]))
+    for stage, values in latencies.items():
+        results[stage] = {"p50": percentile(values, 0.5),
+                          "p90": percentile(values, 0.9),
+                          "p99": percentile(values, 0.99),
+                          "max": max(values)}
+        logging.info("{:<8s} p50 {:.4f} s  p90 {:.4f} s  p99 {:.4f} s  "
+                     "max {:.4f} s".format(stage, results[stage]["p50"],
+                                           results[stage]["p90"],
+                                           results[stage]["p99"],
+                                           results[stage]["max"]))
+    return results
+
+
+def main():
+    backend = sys.argv[1] if len(sys.argv) > 1 else BACKEND
+    jobs = int(sys.argv[2]) if len(sys.argv) > 2 else JOBS
+    cores = int(sys.argv[3]) if len(sys.argv) > 3 else CORES
+    if backend not in ("gamess", "smina", "ladder"):
+        sys.exit("Unknown backend {}. Use gamess, smina or ladder."
+                 .format(backend))
+
+    batch_time = start_batch_log("benchmark {}.log")
+
+    # The stubs read their cost from the environment
+    os.environ["STUB_SLEEP_SECONDS"] = str(STUB_SLEEP_SECONDS)
+    os.environ["STUB_CPU_SECONDS"] = str(STUB_CPU_SECONDS)
+    os.environ["STUB_LOG_BYTES"] = str(STUB_LOG_BYTES)
+
+    if BENCHMARK_DIR:
+        os.makedirs(BENCHMARK_DIR, exist_ok=True)
+    benchmark_dir = tempfile.mkdtemp(prefix="batch_benchmark_",
+                                     dir=BENCHMARK_DIR or None)
+    logging.info("Running {} {} jobs on {} processors in {}."
+                 .format(jobs, backend, cores, benchmark_dir))
+
+    start_time = time.time()
+    try:
+        if backend == "gamess":
+            finished = run_gamess(benchmark_dir, jobs, cores)
+        elif backend == "ladder":
+            finished = run_ladder(benchmark_dir, jobs, cores)
+        else:
+            finished = run_smina(benchmark_dir, jobs, cores)
+        wall_time = time.time() - start_time
+    finally:
+        shutil.rmtree(benchmark_dir, ignore_errors=True)
+
+    results = report(backend, jobs, cores, finished, wall_time)
+    if backend == "ladder":
+        steps, overlapping = ladder_overlap(finished)
+        results["ladder_steps"] = steps
+        results["overlapping_ladder_steps"] = overlapping
+        logging.info("Ladder steps run side by side: {} of {}."
+                     .format(overlapping, steps))
+    if BENCHMARK_RESULTS:
+        results["batch"] = batch_time
+        with open(BENCHMARK_RESULTS, 'a') as results_file:
+            results_file.write(json.dumps(results) + "\n")
+    if backend == "ladder" and overlapping < steps:
+        sys.exit("Steps of different molecules did not run side by side.")
+    logging.info("Benchmark complete.")
+
+
+if __name__ == "__main__":
+    main()
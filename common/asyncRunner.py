@@ -0,0 +1,290 @@
+"""
+This script contains the asyncio execution core shared by the batch scripts.
+It is not designed to be run independently.
+
+A batch is a pipeline of three stages. Inputs are staged one at a time in
+queue order, each job then runs as its own task while the next input is
+staged, and every finished job is harvested (its output moved back, parsed
+and recorded) as soon as it exits. Jobs wait for processors in a counting
+semaphore, so the number running at once is bounded by the processors given
+to the batch rather than by a polling loop.
+
+The program being run is supplied by a runner (GamessRunner, SminaRunner)
+with these members:
+    name                  program name used in the batch log
+    processor_policy      object choosing processors per job, or None
+    prepare(queue)        called once with the queue before any job starts
+    processors_for(input, default)   processors wanted for an input
+    stage_job(input)      returns the job dict, or None to skip the input
+    execute_job(job, processors, monitor_interval)   coroutine running the
+                          job; job["cores"] holds the processors it may be
+                          pinned to, or None
+    finish_job(job)       harvests the job. By then job["exit_status"] and
+                          job["wall_time"] must be set, and job["usage"]
+                          holds the job's resource usage if it ran.
+    fail_job(job)         records a job whose run or harvest raised an error
+Runners may add the seconds spent in parts of a job to job["timings"] for
+batchMetrics. execute_job keeps the job's process in job["process"], so a
+batch that is stopped can stop the jobs still running.
+
+An error in one job is logged and that job is recorded as failed, while the
+other jobs carry on. When the batch itself stops, for example on Ctrl-C, every
+job still running is stopped and waited for before run_batch returns.
+"""
+
+import asyncio
+import logging
+import os
+import signal
+import time
+
+from processUsage import AsyncChildProcess
+
+STOP_TIMEOUT = 30  # Seconds a stopped job is given to exit before it is killed
+
+
+class CoreBudget:
+    # Hands out the free processors of a batch. Processors are numbered, so
+    # jobs can be pinned to the ones they were given.
+    def __init__(self, cores):
+        if isinstance(cores, int):
+            cores = range(cores)
+        self.free_cores = list(cores)
+        self.condition = asyncio.Condition()
+
+    async def acquire(self, minimum, choose=None):
+        # Waits until minimum processors are free, then takes choose(free)
+        # of them (minimum by default) and returns the processors taken
+        async with self.condition:
+            await self.condition.wait_for(
+                lambda: len(self.free_cores) >= minimum)
+            count = minimum if choose is None else choose(len(self.free_cores))
+            cores = self.free_cores[:count]
+            del self.free_cores[:count]
+            return cores
+
+    async def release(self, cores):
+        async with self.condition:
+            self.free_cores = sorted(self.free_cores + cores)
+            self.condition.notify_all()
+
+
+def available_cores():
+    # Processors this process may run on
+    if hasattr(os, "sched_getaffinity"):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+async def start_process(command, output_log, cwd=None, env=None, cores=None):
+    # Starts command in its own session with stdout written to output_log,
+    # pinned to cores if given. The process's resource usage is kept in its
+    # rusage once it exits.
+    return AsyncChildProcess(command, output_log, cwd, env, cores)
+
+
+async def stop_process(process):
+    # Stops a job's process group, which was started in its own session,
+    # and waits for it to exit
+    if process is None or process.returncode is not None:
+        return
+    try:
+        os.killpg(process.pid, signal.SIGTERM)
+        try:
+            await asyncio.wait_for(process.wait(), STOP_TIMEOUT)
+            return
+        except asyncio.TimeoutError:
+            os.killpg(process.pid, signal.SIGKILL)
+    except ProcessLookupError:
+        pass
+    await process.wait()
+
+
+async def run_pipeline(next_item, stage, execute, harvest, fail=None):
+    # Runs every item returned by next_item() until it returns None. stage
+    # is awaited for one item at a time and may wait for processors; it
+    # returns the job to run or None to skip the item. Each job is executed
+    # as a task and passed to harvest as soon as it finishes. harvest may
+    # add items, so next_item is asked again after every finished job. A job
+    # whose execute or harvest raises is passed to fail, if given; otherwise
+    # the error stops the batch. Jobs still running when the batch stops are
+    # cancelled and waited for.
+    running = set()
+    try:
+        while True:
+            item = next_item()
+            if item is None:
+                if not running:
+                    break
+                done, running = await asyncio.wait(
+                    running, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    task.result()
+                continue
+
+            job = await stage(item)
+            if job is not None:
+                running.add(asyncio.create_task(_execute_and_harvest(
+                    job, execute, harvest, fail)))
+            for task in [task for task in running if task.done()]:
+                running.remove(task)
+                task.result()
+    finally:
+        for task in running:
+            task.cancel()
+        await asyncio.gather(*running, return_exceptions=True)
+
+
+async def _execute_and_harvest(job, execute, harvest, fail):
+    try:
+        await execute(job)
+        await harvest(job)
+    except Exception:
+        if fail is None:
+            raise
+        fail(job)
+
+
+def run_batch(runner, queue, core_budget, min_processors, monitor_interval,
+              on_complete=None, number_of_processors=4, metrics=None,
+              max_jobs=0):
+    # Runs the inputs in queue, keeping up to core_budget processors busy.
+    # core_budget is a number of processors or a list of the processors to
+    # pin jobs to. Free processors are split evenly between the jobs that
+    # can start and the finished jobs still being harvested, whose
+    # on_complete may queue another input, so the tail of the batch gives
+    # the remaining jobs more processors each, unless the runner has a
+    # processor policy choosing the count for each job. A core_budget of 0 runs one job at a time on
+    # number_of_processors (or the policy's count). queue is a list, which
+    # on_complete may append new inputs to, or any other iterable, which is
+    # read as jobs start. on_complete is called with each finished job.
+    # job["times"] records when each job was queued, staged, started, exited
+    # and harvested, and each finished job is recorded in metrics (a
+    # BatchMetrics) if given. A max_jobs above 0 runs at most that many jobs
+    # at once, each on min_processors processors instead of an even share.
+    asyncio.run(run_queue(runner, queue, core_budget, min_processors,
+                          monitor_interval, on_complete, number_of_processors,
+                          metrics, max_jobs))
+
+
+async def run_queue(runner, queue, core_budget, min_processors,
+                    monitor_interval, on_complete=None,
+                    number_of_processors=4, metrics=None, max_jobs=0):
+    # The coroutine behind run_batch
+    runner.prepare(queue)
+    budget = CoreBudget(core_budget)
+    total_cores = len(budget.free_cores)
+    min_processors = max(1, min(min_processors, total_cores))
+    one_at_a_time = asyncio.Semaphore(1)
+    # Jobs that have given back their processors but not yet been harvested.
+    # Their harvest may queue another input, so they keep a share.
+    harvesting = 0
+    job_slots = asyncio.Semaphore(max_jobs) if max_jobs > 0 else None
+    input_seconds = {}
+
+    if isinstance(queue, list):
+        def next_input():
+            return queue.pop(0) if queue else None
+
+        def even_share(free_cores):
+            slots = min(len(queue) + harvesting + 1,
+                        free_cores // min_processors)
+            return free_cores // max(slots, 1)
+    else:
+        inputs = iter(queue)
+
+        def next_input():
+            # Inputs may be generated as they are read
+            start = time.perf_counter()
+            input_file = next(inputs, None)
+            if input_file is not None:
+                input_seconds[input_file] = time.perf_counter() - start
+            return input_file
+
+        def even_share(free_cores):
+            # The number of inputs left is unknown
+            return free_cores // max(free_cores // min_processors, 1)
+
+    async def stage(input_file):
+        queued = time.time()
+        generation_seconds = input_seconds.pop(input_file, None)
+        job = await asyncio.to_thread(runner.stage_job, input_file)
+        if job is None:
+            return None
+        job["times"] = {"queued": queued, "staged": time.time()}
+        timings = job.setdefault("timings", {})
+        if generation_seconds is not None:
+            timings["input_generation"] = generation_seconds
+
+        # The staged job waits here for a job slot and processors to be freed
+        if job_slots is not None:
+            await job_slots.acquire()
+        if not total_cores:
+            await one_at_a_time.acquire()
+            job["cores"] = None
+            job["number_of_processors"] = runner.processors_for(
+                input_file, number_of_processors)
+        elif runner.processor_policy is None:
+            job["cores"] = await budget.acquire(
+                min_processors, None if job_slots is not None else even_share)
+            job["number_of_processors"] = len(job["cores"])
+        else:
+            wanted = min(total_cores, max(min_processors, runner.processors_for(
+                input_file, min_processors)))
+            job["cores"] = await budget.acquire(
+                min_processors, lambda free_cores: min(free_cores, wanted))
+            job["number_of_processors"] = len(job["cores"])
+        job["times"]["started"] = time.time()
+        logging.info("Beginning {} job for {} on {} processors."
+                     .format(runner.name, input_file,
+                             job["number_of_processors"]))
+        return job
+
+    async def execute(job):
+        nonlocal harvesting
+        try:
+            await runner.execute_job(job, job["number_of_processors"],
+                                     monitor_interval)
+            harvesting += 1
+        except asyncio.CancelledError:
+            # The batch is stopping
+            logging.warning("Stopping {} job for {}."
+                            .format(runner.name, job["input_file"]))
+            await stop_process(job.get("process"))
+            raise
+        finally:
+            job["times"]["exited"] = time.time()
+            if job["cores"] is None:
+                one_at_a_time.release()
+            else:
+                await budget.release(job["cores"])
+            if job_slots is not None:
+                job_slots.release()
+
+    async def harvest(job):
+        nonlocal harvesting
+        try:
+            await asyncio.to_thread(runner.finish_job, job)
+            logging.info("{} job for {} complete."
+                         .format(runner.name, job["input_file"]))
+            logging.info("Run time: {} hours.".
+                         format(job["wall_time"] / (60 * 60)))
+            if on_complete is not None:
+                on_complete(job)
+        finally:
+            harvesting -= 1
+        job["times"]["harvested"] = time.time()
+        if metrics is not None:
+            metrics.record(job, runner.name)
+
+    def fail(job):
+        # Called while handling the job's error
+        logging.exception("{} job for {} failed. Continuing with the other "
+                          "jobs.".format(runner.name, job["input_file"]))
+        try:
+            runner.fail_job(job)
+        except Exception:
+            logging.exception("Could not record the failure of {}."
+                              .format(job["input_file"]))
+
+    await run_pipeline(next_input, stage, execute, harvest, fail)
@@ -3,7 +3,8 @@
 Written by Stephen E. White
 Last updated : 06DEC2017
 
-This script contains the basis set parameters for the optimizeBatchRun.py program.
+This script contains the basis set parameters for the optimizeBatchRun.py and
+gamessSweepRun.py programs.
 It is not designed to be run independently.
 """
 
@@ -37,9 +38,9 @@ class Correlation:  # CCnWC
 
     # Parameters for basis sets
     # "Basis set": (GBASIS, NGAUSS, NDFUNC, NPFUNC, DIFFSP, DIFFS)
-    correlation_basis_dict = {"cc-pwCVDZ": "CCnWC",
-                              "cc-pwCVTZ": "CCnWC",
-                              "cc-pwCVQZ": "CCnWC"}
+    correlation_basis_dict = {"cc-pwCVDZ": ("CCDWC", "", "", "", "", ""),
+                              "cc-pwCVTZ": ("CCTWC", "", "", "", "", ""),
+                              "cc-pwCVQZ": ("CCQWC", "", "", "", "", "")}
 
 
 class Polarization:
@@ -49,3 +50,11 @@ class Polarization:
     # Parameters for basis sets
     # "Basis set": (GBASIS, NGAUSS, NDFUNC, NPFUNC, DIFFSP, DIFFS)
     polarization_basis_dict = {}
+
+
+# Ladders selected by BASIS_SET in optimizeBatchRun.py, also searched by name
+# for sweeps. Polarization is added once its parameters are complete (see
+# todo.txt).
+BASIS_SET_FAMILIES = {"Pople": (Pople.pople_basis_sets, Pople.pople_basis_dict),
+                      "Correlation": (Correlation.correlation_basis_sets,
+                                      Correlation.correlation_basis_dict)}
@@ -0,0 +1,28 @@
+"""
+This script contains the log setup shared by the batch scripts.
+It is not designed to be run independently.
+
+Each batch writes its log to the console and to a file named after the time
+the batch started, which also names the batch in the results database.
+"""
+
+import datetime
+import logging
+
+
+def start_batch_log(log_filename="{}.log", level=logging.INFO):
+    # Starts logging to the console and to log_filename, in which {} is
+    # replaced by the batch start time. Returns the batch start time.
+    # NOTE: this is different than the gamess .log files.
+    batch_time = datetime.datetime.now().strftime("%Y-%m-%d %H_%M_%S")
+
+    file_out = logging.FileHandler(log_filename.format(batch_time))
+    console_out = logging.StreamHandler()
+    handlers = [file_out, console_out]
+    logging.basicConfig(level=level,
+                        format='%(asctime)s: %(levelname)s: %(message)s',
+                        handlers=handlers)
+
+    logging.info("Beginning log for batch started {}."
+                 .format(batch_time.replace("_", ":")))
+    return batch_time
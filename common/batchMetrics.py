@@ -0,0 +1,153 @@
+"""
+This script contains the per-job timing and metrics export shared by the batch
+scripts. It is not designed to be run independently.
+
+Each finished job is written to the metrics file as one JSON line giving the
+seconds it spent in every stage of the batch:
+    stage             staging the input (asyncRunner pipeline)
+    cleanup           deleting scratch files of a previous run (part of stage)
+    staging           moving the input in and the output back
+    wait              waiting for processors (asyncRunner pipeline)
+    spawn             starting the program's process (part of execute)
+    execute           running the program
+    harvest           collecting and recording the output
+    parse             reading results from the output (part of harvest)
+    input_generation  building the input of a job
+
+The job's resource usage (see processUsage) is written with its timings.
+Running totals of each stage are also written as a Prometheus text file,
+which node_exporter reads when the file is in the directory given to its
+--collector.textfile.directory option.
+"""
+
+import json
+import os
+import time
+from contextlib import contextmanager
+
+# Pipeline stages recorded by asyncRunner as job["times"] timestamps
+PIPELINE_STAGES = [("stage", "queued", "staged"),
+                   ("wait", "staged", "started"),
+                   ("execute", "started", "exited"),
+                   ("harvest", "exited", "harvested")]
+
+
+@contextmanager
+def timed(timings, stage):
+    # Adds the seconds spent in the with block to timings[stage]. timings
+    # may be None when the caller does not keep them.
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        if timings is not None:
+            timings[stage] = (timings.get(stage, 0) +
+                              time.perf_counter() - start)
+
+
+def job_timings(job):
+    # Seconds spent in each stage of a finished job
+    timings = {}
+    times = job.get("times", {})
+    for stage, start, end in PIPELINE_STAGES:
+        if start in times and end in times:
+            timings[stage] = times[end] - times[start]
+    if "staging_time" in job:
+        timings["staging"] = job["staging_time"]
+    timings.update(job.get("timings", {}))
+    return timings
+
+
+class BatchMetrics:
+    # Either file may be "" to leave it out
+    def __init__(self, metrics_file, prometheus_file="", batch_time=""):
+        self.metrics_file = None
+        if metrics_file:
+            self.metrics_file = open(metrics_file, 'a')
+        self.prometheus_file = prometheus_file
+        self.batch_time = batch_time
+        self.stage_seconds = {}
+        self.stage_counts = {}
+        self.job_counts = {}
+        self.cpu_seconds = {}
+        self.max_rss_kb = {}
+
+    def record(self, job, program):
+        timings = job_timings(job)
+        succeeded = job.get("exit_status") == 0
+        if self.metrics_file is not None:
+            line = {"time": time.time(),
+                    "batch": self.batch_time,
+                    "program": program,
+                    "job": job["input_file"],
+                    "exit_status": job.get("exit_status"),
+                    "processors": job.get("number_of_processors"),
+                    "wall_time": job.get("wall_time"),
+                    "staging_bytes": job.get("staging_bytes"),
+                    "timings": {stage: round(seconds, 6)
+                                for stage, seconds in timings.items()},
+                    "usage": job.get("usage")}
+            self.metrics_file.write(json.dumps(line) + "\n")
+            self.metrics_file.flush()
+
+        for stage, seconds in timings.items():
+            key = (program, stage)
+            self.stage_seconds[key] = self.stage_seconds.get(key, 0) + seconds
+            self.stage_counts[key] = self.stage_counts.get(key, 0) + 1
+        key = (program, "succeeded" if succeeded else "failed")
+        self.job_counts[key] = self.job_counts.get(key, 0) + 1
+        usage = job.get("usage")
+        if usage is not None:
+            for mode in ("user", "system"):
+                key = (program, mode)
+                self.cpu_seconds[key] = (self.cpu_seconds.get(key, 0) +
+                                         usage[mode + "_cpu"])
+            self.max_rss_kb[program] = max(self.max_rss_kb.get(program, 0),
+                                           usage["max_rss_kb"])
+        if self.prometheus_file:
+            self.write_prometheus()
+
+    def write_prometheus(self):
+        # Written to a temporary file and renamed so node_exporter never
+        # reads a partly written file
+        lines = ["# HELP batch_stage_seconds Seconds finished batch jobs "
+                 "spent in each stage.",
+                 "# TYPE batch_stage_seconds summary"]
+        for program, stage in sorted(self.stage_seconds):
+            labels = '{{program="{}",stage="{}"}}'.format(program, stage)
+            lines.append("batch_stage_seconds_sum{} {:.6f}".format(
+                labels, self.stage_seconds[(program, stage)]))
+            lines.append("batch_stage_seconds_count{} {}".format(
+                labels, self.stage_counts[(program, stage)]))
+        lines += ["# HELP batch_jobs_total Finished batch jobs.",
+                  "# TYPE batch_jobs_total counter"]
+        for program, status in sorted(self.job_counts):
+            lines.append('batch_jobs_total{{program="{}",status="{}"}} {}'
+                         .format(program, status,
+                                 self.job_counts[(program, status)]))
+        lines += ["# HELP batch_cpu_seconds_total CPU time used by finished "
+                  "batch jobs.",
+                  "# TYPE batch_cpu_seconds_total counter"]
+        for program, mode in sorted(self.cpu_seconds):
+            lines.append('batch_cpu_seconds_total{{program="{}",mode="{}"}} '
+                         '{:.6f}'.format(program, mode,
+                                         self.cpu_seconds[(program, mode)]))
+        lines += ["# HELP batch_job_max_rss_bytes Largest RSS of any process "
+                  "of a finished batch job.",
+                  "# TYPE batch_job_max_rss_bytes gauge"]
+        for program in sorted(self.max_rss_kb):
+            lines.append('batch_job_max_rss_bytes{{program="{}"}} {}'
+                         .format(program, self.max_rss_kb[program] * 1024))
+        lines += ["# HELP batch_last_job_timestamp_seconds Time the last "
+                  "batch job finished.",
+                  "# TYPE batch_last_job_timestamp_seconds gauge",
+                  "batch_last_job_timestamp_seconds {:.3f}".format(time.time())]
+
+        temporary_name = self.prometheus_file + ".tmp"
+        with open(temporary_name, 'w') as prometheus_file:
+            prometheus_file.write("\n".join(lines) + "\n")
+        os.replace(temporary_name, self.prometheus_file)
+
+    def close(self):
+        if self.metrics_file is not None:
+            self.metrics_file.close()
@@ -0,0 +1,124 @@
+"""
+This script contains the file staging used to move gamess inputs and output
+logs in and out of the gamess directory.
+It is not designed to be run independently.
+
+Files are staged without copying data when the source and destination are on
+the same filesystem: inputs are hardlinked and output logs are renamed. When
+they are not, the data is copied inside the kernel, first as a reflink, then
+with copy_file_range and finally with sendfile, so a large log is never read
+into this process.
+"""
+
+import errno
+import fcntl
+import logging
+import os
+import shutil
+import time
+
+FICLONE = 0x40049409  # ioctl request for a reflink (btrfs, xfs)
+CHUNK_BYTES = 64 * 1024 * 1024  # Bytes handed to the kernel per call
+
+# Errors meaning a method is not supported between these files
+UNSUPPORTED_ERRORS = {errno.EXDEV, errno.EINVAL, errno.ENOSYS, errno.ENOTTY,
+                      errno.EOPNOTSUPP, errno.EPERM, errno.EMLINK,
+                      errno.EBADF}
+
+
+def _unsupported(error):
+    return isinstance(error, AttributeError) or \
+        error.errno in UNSUPPORTED_ERRORS
+
+
+def _reflink(source_fd, destination_fd, size):
+    # The destination shares the source's blocks, so no bytes are moved
+    fcntl.ioctl(destination_fd, FICLONE, source_fd)
+    return 0
+
+
+def _copy_file_range(source_fd, destination_fd, size):
+    copied = 0
+    while copied < size:
+        sent = os.copy_file_range(source_fd, destination_fd,
+                                  min(CHUNK_BYTES, size - copied),
+                                  copied, copied)
+        if sent == 0:
+            break
+        copied += sent
+    return copied
+
+
+def _sendfile(source_fd, destination_fd, size):
+    copied = 0
+    while copied < size:
+        sent = os.sendfile(destination_fd, source_fd, copied,
+                           min(CHUNK_BYTES, size - copied))
+        if sent == 0:
+            break
+        copied += sent
+    return copied
+
+
+def _copy(source, destination):
+    # Copies source to destination with the cheapest method the filesystems
+    # support. Returns the method and the number of bytes moved.
+    with open(source, 'rb') as source_file, \
+            open(destination, 'wb') as destination_file:
+        source_fd = source_file.fileno()
+        destination_fd = destination_file.fileno()
+        size = os.fstat(source_fd).st_size
+        for method, copier in (("reflink", _reflink),
+                               ("copy_file_range", _copy_file_range),
+                               ("sendfile", _sendfile)):
+            try:
+                return method, copier(source_fd, destination_fd, size)
+            except (AttributeError, OSError) as error:
+                if not _unsupported(error):
+                    raise
+                os.ftruncate(destination_fd, 0)
+        shutil.copyfileobj(source_file, destination_file, CHUNK_BYTES)
+        return "copy", size
+
+
+def stage_file(source, destination, move=False, link=True):
+    # Puts source at destination. A moved file is renamed and a copied file
+    # is hardlinked (if link is True), falling back to a copy across
+    # filesystems. Returns a dict with the method used, the file size, the
+    # bytes actually moved and the time taken. Raises FileNotFoundError if
+    # source does not exist.
+    start_time = time.time()
+    size = os.stat(source).st_size
+    if os.path.realpath(source) == os.path.realpath(destination):
+        raise shutil.SameFileError("{} and {} are the same file"
+                                   .format(source, destination))
+
+    method = None
+    bytes_moved = 0
+    try:
+        if move:
+            os.replace(source, destination)
+            method = "rename"
+        elif link:
+            try:
+                os.remove(destination)
+            except FileNotFoundError:
+                pass
+            os.link(source, destination)
+            method = "hardlink"
+    except OSError as error:
+        if not _unsupported(error):
+            raise
+    if method is None:
+        method, bytes_moved = _copy(source, destination)
+        if move:
+            os.remove(source)
+
+    staging = {"method": method,
+               "size": size,
+               "bytes_moved": bytes_moved,
+               "seconds": time.time() - start_time}
+    logging.debug("Staged {} to {} by {}: {} of {} bytes moved in {:.3f} s."
+                  .format(source, destination, method, bytes_moved, size,
+                          staging["seconds"]))
+    return staging
@@ -0,0 +1,177 @@
+"""
+This script contains the gamess input builders shared by the gamess scripts.
+It is not designed to be run independently.
+
+Inputs are handled as lists of lines in the layout used throughout this
+repository: single-line groups such as $CONTRL and $BASIS, then a $DATA group
+whose title line is followed by the symmetry line (C1) and one line per atom.
+
+A sweep is the Cartesian product of a template input with sweep axes: basis
+sets from basisSets.py, $CONTRL options such as DFTTYP and SCFTYP, and the
+frames of a multi-frame .xyz file. Points are generated one at a time, so a
+sweep of any size can be fed to a batch as it runs.
+
+Inputs of the next step of a basis set ladder can read the orbitals and
+hessian of the previous step from its .dat file as a warm start.
+"""
+
+import itertools
+import re
+
+from basisSets import BASIS_SET_FAMILIES
+from molecule import Molecule
+
+# $BASIS keywords in the order of the parameters in basisSets.py
+BASIS_KEYWORDS = ["GBASIS", "NGAUSS", "NDFUNC", "NPFUNC", "DIFFSP", "DIFFS"]
+
+ELEMENTS = ["H", "He",
+            "Li", "Be", "B", "C", "N", "O", "F", "Ne",
+            "Na", "Mg", "Al", "Si", "P", "S", "Cl", "Ar",
+            "K", "Ca", "Sc", "Ti", "V", "Cr", "Mn", "Fe", "Co", "Ni", "Cu",
+            "Zn", "Ga", "Ge", "As", "Se", "Br", "Kr",
+            "Rb", "Sr", "Y", "Zr", "Nb", "Mo", "Tc", "Ru", "Rh", "Pd", "Ag",
+            "Cd", "In", "Sn", "Sb", "Te", "I", "Xe"]
+
+
+def basis_parameters(basis_set):
+    # Parameters of a basis set from any family in basisSets.py
+    for basis_sets, basis_dict in BASIS_SET_FAMILIES.values():
+        if basis_set in basis_dict:
+            return basis_dict[basis_set]
+    raise KeyError("Basis set {} is not in basisSets.py".format(basis_set))
+
+
+def basis_line(basis_set):
+    # $BASIS group of a basis set. Empty parameters are left out.
+    options = ["{}={}".format(keyword, value) for keyword, value
+               in zip(BASIS_KEYWORDS, basis_parameters(basis_set)) if value]
+    return " $BASIS {} $END\n".format(" ".join(options))
+
+
+def orbitals_compatible(basis_set, next_basis_set):
+    # True when orbitals of basis_set can be read as the guess of
+    # next_basis_set. gamess only reads orbitals over the same number of
+    # basis functions, so the basis sets may differ only in NGAUSS, the
+    # number of primitives in each function.
+    parameters = list(basis_parameters(basis_set))
+    next_parameters = list(basis_parameters(next_basis_set))
+    del parameters[1], next_parameters[1]
+    return parameters == next_parameters
+
+
+def set_group_options(lines, group, options):
+    # Sets KEYWORD=value options of a single-line group, adding those the
+    # group does not have yet
+    new_lines = []
+    for line in lines:
+        if "$" + group in line:
+            for keyword, value in options.items():
+                option = "{}={}".format(keyword, value)
+                line, found = re.subn(r"\b{}=\S+".format(keyword), option,
+                                      line)
+                if not found:
+                    line = line.replace("$END", option + " $END")
+        new_lines.append(line)
+    return new_lines
+
+
+def set_warm_start(lines, orbitals=0, hessian=False):
+    # Header lines that read the given number of orbitals and the hessian
+    # from $VEC and $HESS groups after $DATA. A warm start copied from the
+    # header of an earlier step is removed first.
+    lines = [line for line in lines
+             if not ("$GUESS" in line and "MOREAD" in line)]
+    lines = [re.sub(r"\s+HESS=READ\b", "", line) if "$STATPT" in line
+             else line for line in lines]
+    lines = [line for line in lines if line.split() != ["$STATPT", "$END"]]
+
+    # New groups go before $DATA
+    new_groups = []
+    if orbitals:
+        lines = [line for line in lines if "$GUESS" not in line]
+        new_groups.append(" $GUESS GUESS=MOREAD NORB={} $END\n"
+                          .format(orbitals))
+    if hessian:
+        if any("$STATPT" in line for line in lines):
+            lines = set_group_options(lines, "STATPT", {"HESS": "READ"})
+        else:
+            new_groups.append(" $STATPT HESS=READ $END\n")
+    data_index = next(index for index, line in enumerate(lines)
+                      if "$DATA" in line)
+    return lines[:data_index] + new_groups + lines[data_index:]
+
+
+def read_template(input_name):
+    # Returns the lines of a gamess input up to and including the symmetry
+    # line (the header) and its atom lines
+    with open(input_name, 'r') as template:
+        lines = template.readlines()
+    for index, line in enumerate(lines):
+        if line.strip() == "C1":
+            atoms = [atom for atom in lines[index + 1:]
+                     if atom.strip() and "$END" not in atom]
+            return lines[:index + 1], atoms
+    raise ValueError("{} has no C1 symmetry line".format(input_name))
+
+
+def read_xyz_frames(xyz_name):
+    # Yields the atoms of each frame of a multi-frame .xyz file as
+    # (symbol, x, y, z), one frame at a time
+    with open(xyz_name, 'r') as xyz_file:
+        while True:
+            count_line = xyz_file.readline()
+            if not count_line.strip():
+                return
+            xyz_file.readline()  # Comment line
+            atoms = []
+            for atom in range(int(count_line)):
+                symbol, x, y, z = xyz_file.readline().split()[:4]
+                atoms.append((symbol, float(x), float(y), float(z)))
+            yield atoms
+
+
+def atom_lines(atoms):
+    # $DATA lines of (symbol, x, y, z) atoms
+    symbols = [atom[0].capitalize() for atom in atoms]
+    charges = [ELEMENTS.index(symbol) + 1 for symbol in symbols]
+    return Molecule(symbols, charges,
+                    [atom[1:] for atom in atoms]).data_lines()
+
+
+def sweep_points(basis_sets, contrl_axes, xyz_name=""):
+    # Yields (basis set, $CONTRL options, frame index, atoms) for every
+    # point of a sweep. contrl_axes maps each $CONTRL keyword to its values.
+    # An empty axis keeps the template's setting (None), and without an .xyz
+    # file the template's geometry is used (frame None). Frames are read as
+    # the sweep reaches them.
+    keywords = list(contrl_axes)
+    if xyz_name:
+        frames = enumerate(read_xyz_frames(xyz_name))
+    else:
+        frames = [(None, None)]
+    for frame, atoms in frames:
+        for point in itertools.product(basis_sets or [None],
+                                       *[contrl_axes[keyword] or [None]
+                                         for keyword in keywords]):
+            contrl_options = {keyword: value for keyword, value
+                              in zip(keywords, point[1:]) if value is not None}
+            yield point[0], contrl_options, frame, atoms
+
+
+def build_sweep_input(header, template_atoms, basis_set, contrl_options,
+                      atoms, title):
+    # Lines of the input of one sweep point
+    lines = set_group_options(header, "CONTRL", contrl_options)
+    if basis_set is not None:
+        # Templates without a $BASIS group get one before $DATA
+        lines = [line for line in lines if "$BASIS" not in line]
+        data_index = next(index for index, line in enumerate(lines)
+                          if "$DATA" in line)
+        lines.insert(data_index, basis_line(basis_set))
+    # The title is the line before the symmetry line
+    lines[-2] = title + "\n"
+    if atoms is None:
+        lines += template_atoms
+    else:
+        lines += atom_lines(atoms)
+    return lines + [" $END\n"]
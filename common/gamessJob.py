@@ -0,0 +1,216 @@
+"""
+This script contains the gamess job runner shared by the gamess batch scripts.
+It is not designed to be run independently.
+
+Jobs are started with the gamess directory as the working directory of the
+rungms process only, so this process never changes directory and several
+jobs can run at the same time. With a scratch root, each job instead runs in
+its own directory under it with private SCR and USERSCR directories, so jobs
+running side by side never share scratch files. rungms must then take SCR
+and USERSCR from the environment instead of setting them itself.
+
+GamessRunner is the gamess backend of the asyncRunner pipeline, which stages
+the next input while jobs run and harvests each job as soon as it exits.
+"""
+
+import logging
+import os
+import time
+
+from asyncRunner import start_process
+from batchMetrics import timed
+from fileStaging import stage_file
+from gamessLog import exited_gracefully
+from gamessMonitor import LogMonitor, watch_job, watch_job_async
+from jobJournal import DONE, FAILED, RUNNING, STAGED
+from processUsage import ChildProcess, job_usage, log_usage
+from scratchManager import ScratchManager
+
+
+class GamessRunner:
+    name = "gamess"
+
+    def __init__(self, path_to_gamess, temp_binary_dir, supp_output_dir,
+                 version, policy=None, journal=None, scratch_root="",
+                 processor_policy=None):
+        self.path_to_gamess = path_to_gamess
+        self.temp_binary_dir = temp_binary_dir
+        self.supp_output_dir = supp_output_dir
+        self.version = version
+        self.policy = policy
+        self.journal = journal
+        self.processor_policy = processor_policy
+        self.scratch = ScratchManager(
+            [(supp_output_dir, "supplemental output directory"),
+             (temp_binary_dir, "temporary binary directory")], scratch_root)
+
+    def record(self, input_file, state, **details):
+        if self.journal is not None:
+            self.journal.record(input_file, state, **details)
+
+    def processors_for(self, input_file, default):
+        # Processor count chosen by the processor policy, if there is one
+        if self.processor_policy is None:
+            return default
+        return self.processor_policy.processors(os.path.abspath(input_file))
+
+    def prepare(self, input_files):
+        # Starts deleting files left by previous runs of the queued jobs in
+        # the background. Inputs generated as the batch runs are cleaned when
+        # they are staged.
+        if not isinstance(input_files, list):
+            return
+        for input_file in input_files:
+            self.scratch.schedule(input_file.split(".inp")[0])
+
+    def remove_residuals(self, input_file):
+        # Waits until files left by a previous run of this job are deleted.
+        # gamess names them after the input file, so only exact matches are
+        # removed.
+        self.scratch.clean(input_file.split(".inp")[0])
+
+    def stage_job(self, input_file, input_directory=None, output_name=None):
+        # Stages the input file in the job's working directory. Returns the
+        # job, which is not yet running, or None if the input is missing.
+        if output_name is None:
+            output_name = input_file.split("Input.inp")[0] + "Output.log"
+
+        if input_directory is None:
+            input_directory = os.getcwd()
+        timings = {}
+        with timed(timings, "cleanup"):
+            self.remove_residuals(input_file)
+
+        # Jobs run in the gamess directory or in a private scratch root
+        job_root = None
+        working_directory = self.path_to_gamess
+        environment = None
+        if self.scratch.scratch_root:
+            job_root, scr, userscr = self.scratch.create_root(
+                input_file.split(".inp")[0])
+            working_directory = job_root
+            environment = dict(os.environ, SCR=scr, USERSCR=userscr)
+
+        # Stage input file in working directory
+        try:
+            logging.debug("Staging input data file in gamess directory.")
+            staging = stage_file(os.path.join(input_directory, input_file),
+                                 os.path.join(working_directory, input_file))
+        except FileNotFoundError:
+            logging.error("{} not found in gamess directory. Moving to next "
+                          "file.".format(input_file))
+            if job_root is not None:
+                self.scratch.remove_root(job_root)
+            return None
+
+        self.record(input_file, STAGED, job_root=job_root)
+        output_path = os.path.join(working_directory, output_name)
+        return {"input_file": input_file,
+                "output_name": output_name,
+                "input_directory": input_directory,
+                "working_directory": working_directory,
+                "environment": environment,
+                "job_root": job_root,
+                "monitor": LogMonitor(output_path, self.policy),
+                "staging_bytes": staging["bytes_moved"],
+                "staging_time": staging["seconds"],
+                "timings": timings}
+
+    def launch(self, job, number_of_processors):
+        # Opens the job's output log and returns the rungms command line
+        logging.info("Beginning gamess process.")
+        job["number_of_processors"] = number_of_processors
+        job["output_log"] = open(os.path.join(job["working_directory"],
+                                              job["output_name"]), 'w')
+        job["start_time"] = time.time()
+        return [os.path.join(self.path_to_gamess, "rungms"),
+                job["input_file"], self.version, str(number_of_processors)]
+
+    def start_job(self, input_file, number_of_processors,
+                  input_directory=None, output_name=None):
+        job = self.stage_job(input_file, input_directory, output_name)
+        if job is None:
+            return None
+
+        # Run gamess job from the working directory without changing the
+        # working directory of this process
+        command = self.launch(job, number_of_processors)
+        with timed(job["timings"], "spawn"):
+            job["process"] = ChildProcess(command, job["output_log"],
+                                          job["working_directory"],
+                                          job["environment"])
+        self.record(input_file, RUNNING, processors=number_of_processors)
+        return job
+
+    async def execute_job(self, job, number_of_processors, monitor_interval):
+        # Runs a staged job to its exit without blocking the event loop
+        command = self.launch(job, number_of_processors)
+        with timed(job["timings"], "spawn"):
+            job["process"] = await start_process(
+                command, job["output_log"], cwd=job["working_directory"],
+                env=job["environment"])
+        self.record(job["input_file"], RUNNING,
+                    processors=number_of_processors)
+        await watch_job_async(job["process"], job["monitor"],
+                              job["input_file"], monitor_interval)
+
+    def finish_job(self, job):
+        input_file = job["input_file"]
+        output_name = job["output_name"]
+
+        job["output_log"].close()
+        job["exit_status"] = job["process"].returncode
+        job["wall_time"] = time.time() - job["start_time"]
+        job["usage"] = job_usage(job["process"], job["wall_time"],
+                                 job["number_of_processors"])
+        logging.info("gamess process complete.")
+        log_usage("gamess job for {}".format(input_file), job["usage"])
+
+        # Clean up files from run and move output to input directory
+        output_path = os.path.join(job["input_directory"], output_name)
+        try:
+            os.remove(os.path.join(job["working_directory"], input_file))
+            staging = stage_file(
+                os.path.join(job["working_directory"], output_name),
+                output_path, move=True)
+            logging.info("Output file moved to starting directory by {}."
+                         .format(staging["method"]))
+            job["staging_bytes"] += staging["bytes_moved"]
+            job["staging_time"] += staging["seconds"]
+        except FileNotFoundError:
+            logging.warning("Output file not found.")
+        logging.info("Staging moved {} bytes in {:.3f} s."
+                     .format(job["staging_bytes"], job["staging_time"]))
+        if job["job_root"] is not None:
+            self.scratch.harvest(job["job_root"], self.supp_output_dir)
+
+        if job["exit_status"] == 0 and exited_gracefully(output_path):
+            state = DONE
+        else:
+            state = FAILED
+        self.record(input_file, state, exit_status=job["exit_status"],
+                    wall_time=job["wall_time"], usage=job["usage"],
+                    staging_bytes=job["staging_bytes"],
+                    staging_time=job["staging_time"])
+
+    def fail_job(self, job):
+        # The job's journal record is marked failed, so a resumed batch runs
+        # it again
+        output_log = job.get("output_log")
+        if output_log is not None:
+            output_log.close()
+        self.record(job["input_file"], FAILED)
+
+    def run_job(self, input_file, number_of_processors, monitor_interval,
+                output_name=None):
+        # Runs one job to completion. Returns the finished job or None.
+        job = self.start_job(input_file, number_of_processors,
+                             output_name=output_name)
+        if job is None:
+            return None
+        watch_job(job["process"], job["monitor"], input_file, monitor_interval)
+        self.finish_job(job)
+        return job
+
+    def close(self):
+        self.scratch.close()
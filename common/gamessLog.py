@@ -0,0 +1,199 @@
+"""
+This script contains helpers for reading gamess output logs.
+It is not designed to be run independently.
+
+Optimization logs can reach hundreds of MB, so the log is memory-mapped and
+read backwards from the end in blocks of SCAN_BYTES. While a block is read,
+it is searched for each marker whose last occurrence has not been found yet,
+and reading stops once all of them have been found. Usually only the end of
+the log is read, and a log missing a marker is read once rather than once per
+marker. The first SCF of a log with a final energy is then found by a forward
+search from its start.
+"""
+
+import mmap
+import os
+
+TAIL_BYTES = 8192  # Bytes read from the end of a log to find its status
+SCAN_BYTES = 1024 ** 2  # Bytes of a log searched at once for its markers
+
+# Markers of the lines parse_log reads, with text the line must also contain
+MARKERS = {b"EQUILIBRIUM GEOMETRY LOCATED": None,
+           b"ENERGY IS": "FINAL",
+           b"NSERCH:": None,
+           b"TOTAL WALL CLOCK TIME": None,
+           b"TOTAL CPU TIME": None}
+
+
+def read_tail(gamess_output_name, tail_bytes=TAIL_BYTES):
+    try:
+        gamess_output = open(gamess_output_name, 'rb')
+    except FileNotFoundError:
+        return b""
+    with gamess_output:
+        size = os.fstat(gamess_output.fileno()).st_size
+        gamess_output.seek(max(0, size - tail_bytes))
+        return gamess_output.read()
+
+
+def exited_gracefully(gamess_output_name):
+    return b"exited gracefully" in read_tail(gamess_output_name)
+
+
+def read_final_energy(gamess_output_name):
+    # Returns the last "FINAL ... ENERGY IS" value in the log, or None
+    return parse_log(gamess_output_name)["final_energy"]
+
+
+def _line_at(log, index):
+    start = log.rfind(b"\n", 0, index) + 1
+    end = log.find(b"\n", index)
+    if end == -1:
+        end = len(log)
+    return log[start:end].decode(errors="replace"), end + 1
+
+
+def _last_lines(log):
+    # Last line containing each marker, with the index following it, found
+    # in one backwards pass over the log. Markers not in the log are left
+    # out.
+    found = {}
+    end = len(log)
+    while end > 0 and len(found) < len(MARKERS):
+        start = max(0, end - SCAN_BYTES)
+        for marker, required in MARKERS.items():
+            if marker in found:
+                continue
+            # Markers starting in the block, including any running past its
+            # end, which the previous block could not hold in full
+            index = log.rfind(marker, start, end + len(marker) - 1)
+            while index != -1:
+                line, line_end = _line_at(log, index)
+                if required is None or required in line:
+                    found[marker] = (line, line_end)
+                    break
+                index = log.rfind(marker, start, index + len(marker) - 1)
+        end = start
+    return found
+
+
+def _first_line(log, marker, required=None):
+    # First line containing marker (and required, if given)
+    index = 0
+    while True:
+        index = log.find(marker, index)
+        if index == -1:
+            return None, -1
+        line, end = _line_at(log, index)
+        if required is None or required in line:
+            return line, end
+        index = end
+
+
+def _number_after(line, label):
+    try:
+        return float(line.split(label)[1].lstrip(" =").split()[0].rstrip(","))
+    except (IndexError, ValueError):
+        return None
+
+
+def _read_geometry(log, start):
+    # Lines following EQUILIBRIUM GEOMETRY LOCATED up to the first blank line
+    geometry = []
+    while start < len(log):
+        line, start = _line_at(log, start)
+        if not line.strip():
+            break
+        geometry.append(line + "\n")
+    return geometry
+
+
+def parse_log(gamess_output_name):
+    result = {"exited_gracefully": False,
+              "terminated_normally": False,
+              "geometry": None,
+              "final_energy": None,
+              "scf_iterations": None,
+              "first_scf_iterations": None,
+              "geometry_steps": None,
+              "wall_time": None,
+              "cpu_time": None}
+
+    try:
+        gamess_output = open(gamess_output_name, 'rb')
+    except FileNotFoundError:
+        return result
+    with gamess_output:
+        size = os.fstat(gamess_output.fileno()).st_size
+        if size == 0:
+            return result
+        with mmap.mmap(gamess_output.fileno(), 0,
+                       access=mmap.ACCESS_READ) as log:
+            tail = log[max(0, size - TAIL_BYTES):]
+            result["exited_gracefully"] = b"exited gracefully" in tail
+            result["terminated_normally"] = b"TERMINATED NORMALLY" in tail
+
+            last_lines = _last_lines(log)
+            if b"EQUILIBRIUM GEOMETRY LOCATED" in last_lines:
+                line, end = last_lines[b"EQUILIBRIUM GEOMETRY LOCATED"]
+                result["geometry"] = _read_geometry(log, end)
+
+            if b"ENERGY IS" in last_lines:
+                line, end = last_lines[b"ENERGY IS"]
+                result["final_energy"] = _number_after(line, "ENERGY IS")
+                iterations = _number_after(line, "AFTER")
+                if iterations is not None:
+                    result["scf_iterations"] = int(iterations)
+
+                # The first SCF is the one a guess from earlier orbitals
+                # shortens. It is near the start of the log.
+                line, end = _first_line(log, b"ENERGY IS", "FINAL")
+                iterations = _number_after(line, "AFTER")
+                if iterations is not None:
+                    result["first_scf_iterations"] = int(iterations)
+
+            if b"NSERCH:" in last_lines:
+                line, end = last_lines[b"NSERCH:"]
+                step = _number_after(line, "NSERCH:")
+                if step is not None:
+                    result["geometry_steps"] = int(step) + 1
+
+            if b"TOTAL WALL CLOCK TIME" in last_lines:
+                line, end = last_lines[b"TOTAL WALL CLOCK TIME"]
+                result["wall_time"] = _number_after(line, "TOTAL WALL CLOCK TIME")
+
+            if b"TOTAL CPU TIME" in last_lines:
+                line, end = last_lines[b"TOTAL CPU TIME"]
+                result["cpu_time"] = _number_after(line, "TOTAL CPU TIME")
+    return result
+
+
+def read_dat_groups(gamess_dat_name, groups=("$VEC", "$HESS")):
+    # Returns the lines of the last occurrence of each group in a gamess .dat
+    # file, from its first line to its $END line. Groups not in the file are
+    # left out.
+    found = {}
+    try:
+        gamess_dat = open(gamess_dat_name, 'r')
+    except FileNotFoundError:
+        return found
+    with gamess_dat:
+        group = None
+        for line in gamess_dat:
+            if group is None:
+                name = line.split()[0] if line.split() else ""
+                if name in groups:
+                    group = name
+                    lines = [line]
+            else:
+                lines.append(line)
+                if line.strip() == "$END":
+                    found[group] = lines
+                    group = None
+    return found
+
+
+def vec_orbital_count(vec_lines):
+    # Number of orbitals in a $VEC group. The first line of each orbital has
+    # line number 1 in columns 3-5.
+    return sum(1 for line in vec_lines[1:-1] if line[2:5].strip() == "1")
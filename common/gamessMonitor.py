@@ -0,0 +1,167 @@
+"""
+This script contains the monitor for running gamess jobs.
+It is not designed to be run independently.
+
+The monitor follows a job's output log as it grows. Each poll reads only the
+bytes appended since the last poll, updates the job's metrics (geometry step,
+energy, gradient and SCF iterations) and asks an optional policy whether the
+job has stopped converging and should be killed.
+"""
+
+import asyncio
+import logging
+import os
+import re
+import signal
+import subprocess
+
+NSERCH_LINE = re.compile(r"NSERCH:\s*(\d+)\s+E=\s*(\S+)\s+GRAD\. MAX=\s*(\S+)"
+                         r"\s+R\.M\.S\.=\s*(\S+)")
+SCF_ITERATION_LINE = re.compile(r"^\s*(\d+)\s+\d+\s+\d+\s+(-\d+\.\d+)")
+
+
+class ConvergencePolicy:
+    # Decides when a job has stopped converging. A limit of 0 is not checked,
+    # and a job reporting an unconverged SCF is only stopped when
+    # kill_on_unconverged is set.
+    def __init__(self, max_scf_iterations=0, max_stalled_steps=0,
+                 kill_on_unconverged=False):
+        self.max_scf_iterations = max_scf_iterations
+        self.max_stalled_steps = max_stalled_steps
+        self.kill_on_unconverged = kill_on_unconverged
+
+    def kill_reason(self, metrics):
+        if self.kill_on_unconverged and metrics["scf_unconverged"]:
+            return "SCF did not converge"
+        if (self.max_scf_iterations and
+                metrics["scf_iterations"] > self.max_scf_iterations):
+            return "SCF exceeded {} iterations".format(self.max_scf_iterations)
+        if (self.max_stalled_steps and
+                metrics["stalled_steps"] >= self.max_stalled_steps):
+            return "energy has not improved for {} geometry steps" \
+                .format(metrics["stalled_steps"])
+        return None
+
+
+class LogMonitor:
+    def __init__(self, output_path, policy=None):
+        self.output_path = output_path
+        self.policy = policy
+        self.offset = 0
+        self.partial_line = b""
+        self.metrics = {"step": None,
+                        "energy": None,
+                        "gradient_max": None,
+                        "gradient_rms": None,
+                        "scf_iterations": 0,
+                        "scf_unconverged": False,
+                        "stalled_steps": 0,
+                        "best_energy": None}
+
+    def read_new_lines(self):
+        # Reads only the bytes appended since the previous call
+        try:
+            output_log = open(self.output_path, 'rb')
+        except FileNotFoundError:
+            return []
+        with output_log:
+            output_log.seek(self.offset)
+            data = output_log.read()
+        self.offset += len(data)
+        lines = (self.partial_line + data).split(b"\n")
+        self.partial_line = lines.pop()
+        return [line.decode(errors="replace") for line in lines]
+
+    def update(self):
+        # Returns True when a new geometry step or SCF iteration was read
+        changed = False
+        metrics = self.metrics
+        for line in self.read_new_lines():
+            nserch = NSERCH_LINE.search(line)
+            if nserch is not None:
+                metrics["step"] = int(nserch.group(1))
+                metrics["energy"] = float(nserch.group(2))
+                metrics["gradient_max"] = float(nserch.group(3))
+                metrics["gradient_rms"] = float(nserch.group(4))
+                if (metrics["best_energy"] is None or
+                        metrics["energy"] < metrics["best_energy"]):
+                    metrics["best_energy"] = metrics["energy"]
+                    metrics["stalled_steps"] = 0
+                else:
+                    metrics["stalled_steps"] += 1
+                changed = True
+            elif "ITER EX DEM" in line or "ITER EX DEL" in line:
+                metrics["scf_iterations"] = 0  # A new SCF cycle has started
+            elif "SCF IS UNCONVERGED" in line:
+                metrics["scf_unconverged"] = True
+                changed = True
+            else:
+                scf_iteration = SCF_ITERATION_LINE.match(line)
+                if scf_iteration is not None:
+                    metrics["scf_iterations"] = int(scf_iteration.group(1))
+                    changed = True
+        return changed
+
+    def check(self, name):
+        # Logs new metrics and returns a reason to kill the job, if any
+        if self.update():
+            logging.info("{}: step {} energy {} gradient max {} rms {} "
+                         "SCF iterations {}."
+                         .format(name, self.metrics["step"],
+                                 self.metrics["energy"],
+                                 self.metrics["gradient_max"],
+                                 self.metrics["gradient_rms"],
+                                 self.metrics["scf_iterations"]))
+        if self.policy is None:
+            return None
+        return self.policy.kill_reason(self.metrics)
+
+
+def kill_job(process, name, reason):
+    # rungms starts ddikick and gamess.x, so the whole process group is
+    # signalled. The job must have been started with start_new_session=True.
+    logging.warning("Killing gamess job for {}: {}.".format(name, reason))
+    try:
+        os.killpg(process.pid, signal.SIGTERM)
+    except ProcessLookupError:
+        pass
+
+
+def watch_job(process, monitor, name, interval, heartbeat=None):
+    # Waits for a job to finish while monitoring its log. heartbeat, if
+    # given, is called every interval and may return a reason to kill the job.
+    while True:
+        try:
+            process.wait(timeout=interval)
+            break
+        except subprocess.TimeoutExpired:
+            pass
+        reason = monitor.check(name)
+        if reason is None and heartbeat is not None:
+            reason = heartbeat()
+        if reason is not None:
+            kill_job(process, name, reason)
+            process.wait()
+            break
+    monitor.check(name)
+    return process.returncode
+
+
+async def watch_job_async(process, monitor, name, interval, heartbeat=None):
+    # watch_job for a process started with asyncio, which lets the other
+    # jobs of the batch run while this one is waited for
+    while True:
+        try:
+            await asyncio.wait_for(process.wait(), interval)
+            break
+        except asyncio.TimeoutError:
+            pass
+        reason = monitor.check(name)
+        if reason is None and heartbeat is not None:
+            reason = heartbeat()
+        if reason is not None:
+            kill_job(process, name, reason)
+            await process.wait()
+            break
+    monitor.check(name)
+    return process.returncode
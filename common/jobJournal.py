@@ -0,0 +1,69 @@
+"""
+This script contains the crash-safe job journal shared by the batch scripts.
+It is not designed to be run independently.
+
+Every state change of a job (queued, staged, running, done or failed) is
+appended to the journal as one JSON line and flushed to disk with fsync
+before the batch moves on. When a batch is restarted the journal is
+replayed to find the last state of every job, so the batch can continue
+where it stopped without reading any output logs.
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+
+QUEUED = "queued"
+STAGED = "staged"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+
+class JobJournal:
+    def __init__(self, journal_name):
+        self.journal_name = journal_name
+        self.jobs = {}  # Last record of each job
+        self.lock = threading.Lock()  # Jobs are staged in worker threads
+        self.replay()
+        self.journal_file = open(journal_name, 'a')
+
+    def replay(self):
+        try:
+            journal_file = open(self.journal_name, 'r')
+        except FileNotFoundError:
+            return
+        with journal_file:
+            for line in journal_file:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # A line cut short by a crash is ignored
+                    logging.warning("Ignoring damaged line in job journal.")
+                    continue
+                self.jobs[record["job"]] = record
+        logging.info("Replayed {} jobs from {}."
+                     .format(len(self.jobs), self.journal_name))
+
+    def record(self, job, state, **details):
+        # Details of earlier records of the job are carried forward
+        with self.lock:
+            record = dict(self.jobs.get(job, {}))
+            record.update(details, job=job, state=state, time=time.time())
+            self.journal_file.write(json.dumps(record) + "\n")
+            self.journal_file.flush()
+            os.fsync(self.journal_file.fileno())
+            self.jobs[job] = record
+
+    def state(self, job):
+        record = self.jobs.get(job)
+        return None if record is None else record["state"]
+
+    def jobs_in_state(self, *states):
+        return {job for job, record in self.jobs.items()
+                if record["state"] in states}
+
+    def close(self):
+        self.journal_file.close()
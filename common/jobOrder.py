@@ -0,0 +1,103 @@
+"""
+This script contains the queue ordering for gamess batches.
+It is not designed to be run independently.
+
+Jobs are started longest first (the LPT heuristic), so the largest molecules
+no longer start last and leave the batch finishing on a single long job. The
+length of a job is its predicted run time from the processor cost model when
+past runs allow it, and otherwise the cube of its electron count, which only
+ranks jobs. The predicted makespan of a batch is found by replaying the
+concurrent scheduler against the cost model.
+"""
+
+import os
+
+from processorPolicy import read_electron_count
+
+
+def estimate_cost(input_file, cost_model=None):
+    # Predicted single processor run time in seconds, or the cube of the
+    # electron count without a model. Unreadable inputs cost 0.
+    input_path = os.path.abspath(input_file)
+    if cost_model is not None:
+        predicted_time = cost_model.predict(input_path, 1)
+        if predicted_time is not None:
+            return predicted_time
+    electrons = read_electron_count(input_path)
+    return 0 if electrons is None else electrons ** 3
+
+
+def order_longest_first(input_files, cost_model=None):
+    # Jobs of equal cost keep their file name order
+    costs = {input_file: estimate_cost(input_file, cost_model)
+             for input_file in input_files}
+    return sorted(input_files, key=lambda input_file: (-costs[input_file],
+                                                        input_file))
+
+
+def insert_longest_first(queue, input_file, sort_keys, cost_model=None):
+    # Inserts input_file into a queue in the order of order_longest_first.
+    # sort_keys holds the sort key of every input queued so far and gains
+    # input_file's, so each input's cost is estimated only once.
+    sort_keys[input_file] = (-estimate_cost(input_file, cost_model),
+                             input_file)
+    low, high = 0, len(queue)
+    while low < high:
+        middle = (low + high) // 2
+        if sort_keys[queue[middle]] < sort_keys[input_file]:
+            low = middle + 1
+        else:
+            high = middle
+    queue.insert(low, input_file)
+
+
+def predict_makespan(runner, cost_model, queue, core_budget, min_processors,
+                     number_of_processors):
+    # Predicted wall time of running queue, replaying run_queue (or
+    # running one job at a time when core_budget is 0). Returns None when a
+    # job's run time cannot be predicted.
+    if cost_model is None:
+        return None
+
+    def predict(input_file, processors):
+        return cost_model.predict(os.path.abspath(input_file), processors)
+
+    def processors_for(input_file, default):
+        if runner.processor_policy is None:
+            return default
+        return runner.processor_policy.processors(
+            os.path.abspath(input_file), log=False)
+
+    if not core_budget:
+        total_time = 0
+        for input_file in queue:
+            predicted_time = predict(input_file, processors_for(
+                input_file, number_of_processors))
+            if predicted_time is None:
+                return None
+            total_time += predicted_time
+        return total_time
+
+    running = []  # (finish time, processors) of each running job
+    free_cores = core_budget
+    min_processors = min(min_processors, core_budget)
+    now = 0
+    for index, input_file in enumerate(queue):
+        # Each job waits for min_processors free cores, as in run_queue
+        while free_cores < min_processors:
+            running.sort()
+            now, processors = running.pop(0)
+            free_cores += processors
+
+        if runner.processor_policy is None:
+            slots = min(len(queue) - index, free_cores // min_processors)
+            processors = free_cores // max(slots, 1)
+        else:
+            processors = min(free_cores, core_budget, max(
+                min_processors, processors_for(input_file, min_processors)))
+        predicted_time = predict(input_file, processors)
+        if predicted_time is None:
+            return None
+        running.append((now + predicted_time, processors))
+        free_cores -= processors
+    return max([finish for finish, processors in running] + [now])
@@ -0,0 +1,93 @@
+"""
+This script contains the Molecule geometry type shared by the gamess scripts.
+It is not designed to be run independently.
+
+A Molecule holds the atom names, nuclear charges and an (N, 3) float64 array
+of Cartesian coordinates in Angstroms. Geometries are read from the geometry
+blocks of gamess output logs and from $DATA atom lines, converting all numbers
+of a block at once, and are compared as arrays without going back to text.
+
+$DATA lines are written in the fixed columns gamess uses for geometries in
+its logs, with a space before every number so that fields stay apart when a
+number is too wide for its column. Numbers that the fixed columns would round
+are written in full instead, so a Molecule written to $DATA lines reads back
+unchanged.
+"""
+
+import numpy as np
+
+# Columns of an atom line: name, nuclear charge, x, y, z. Each number is
+# preceded by a separating space.
+NAME_WIDTH = 10
+CHARGE_FORMAT = " %4.1f"
+COORDINATE_FORMAT = " %14.10f"
+
+
+def _format_exactly(values, number_format):
+    # Formats values in fixed columns, falling back to the shortest exact
+    # representation where the columns would round a value
+    text = np.char.mod(number_format, values)
+    inexact = text.astype(np.float64) != values
+    text = text.astype(object)
+    for index in zip(*np.nonzero(inexact)):
+        text[index] = " " + repr(float(values[index]))
+    return text
+
+
+class Molecule:
+    __slots__ = ("symbols", "charges", "coordinates")
+
+    def __init__(self, symbols, charges, coordinates):
+        self.symbols = tuple(symbols)
+        self.charges = np.asarray(charges, dtype=np.float64)
+        self.coordinates = np.asarray(coordinates,
+                                      dtype=np.float64).reshape(-1, 3)
+
+    @classmethod
+    def from_data_lines(cls, lines):
+        # Molecule from atom lines (name, charge, x, y, z). Blank lines are
+        # skipped, and any other line that is not an atom raises ValueError.
+        fields = [line.split() for line in lines if line.strip()]
+        for atom in fields:
+            if len(atom) < 5:
+                raise ValueError("Not an atom line: {}".format(" ".join(atom)))
+        if not fields:
+            return cls([], [], np.empty((0, 3)))
+        try:
+            numbers = np.array([atom[1:5] for atom in fields],
+                               dtype=np.float64)
+        except ValueError as error:
+            raise ValueError("Could not read atom lines: {}".format(error))
+        return cls([atom[0] for atom in fields], numbers[:, 0], numbers[:, 1:])
+
+    @classmethod
+    def from_geometry_lines(cls, lines):
+        # Molecule from a geometry block of a gamess log, as read by
+        # gamessLog.parse_log. The atoms follow the dashed line under the
+        # column titles; the title lines above it are skipped.
+        for index, line in enumerate(lines):
+            if line.strip().startswith("---"):
+                return cls.from_data_lines(lines[index + 1:])
+        return cls.from_data_lines(lines)
+
+    def __len__(self):
+        return len(self.symbols)
+
+    def __repr__(self):
+        return "Molecule({})".format(" ".join(self.symbols))
+
+    def data_lines(self):
+        # $DATA atom lines of the molecule
+        charges = _format_exactly(self.charges, CHARGE_FORMAT)
+        coordinates = _format_exactly(self.coordinates, COORDINATE_FORMAT)
+        return ["{:<{}}{}{}{}{}\n".format(symbol, NAME_WIDTH, charge, *xyz)
+                for symbol, charge, xyz
+                in zip(self.symbols, charges, coordinates)]
+
+    def rmsd(self, other):
+        # RMSD in Angstroms from another geometry of the same atoms, or None
+        # when the atoms differ
+        if len(self) == 0 or self.symbols != other.symbols:
+            return None
+        return float(np.sqrt(np.mean(np.sum(
+            (self.coordinates - other.coordinates) ** 2, axis=1))))
@@ -0,0 +1,130 @@
+"""
+This script contains the process wrappers that record the resource usage of
+each job. It is not designed to be run independently.
+
+A job's process is reaped with os.wait4 by a thread of its own instead of by
+subprocess or asyncio, which keep only the exit status. The usage wait4
+returns covers the process and every process it started and waited for
+(ddikick.x and gamess.x under rungms), so CPU times and I/O are the totals of
+the job and max RSS is that of its largest process.
+"""
+
+import asyncio
+import logging
+import os
+import subprocess
+import threading
+
+LOW_CPU_EFFICIENCY = 0.5  # Warn about jobs using less of their processors
+
+
+def _pin_to(cores, name):
+    # Function pinning the child process to cores before the program starts,
+    # so the program and everything it starts run only on them. Returns None
+    # when the process cannot be pinned to cores.
+    if cores is None or not hasattr(os, "sched_setaffinity"):
+        return None
+    cores = set(cores)
+    if not cores or not cores <= os.sched_getaffinity(0):
+        logging.warning("Could not set CPU affinity for {}: processors {} "
+                        "are not available.".format(name, sorted(cores)))
+        return None
+
+    def pin():
+        try:
+            os.sched_setaffinity(0, cores)
+        except OSError:
+            pass  # The program runs unpinned
+    return pin
+
+
+class ChildProcess:
+    # A program started in its own session with stdout written to output_log,
+    # pinned to cores if given. wait, returncode and pid behave as they do for
+    # subprocess.Popen.
+    def __init__(self, command, output_log, cwd=None, env=None, cores=None):
+        self.args = command
+        self.popen = subprocess.Popen(command, cwd=cwd, env=env,
+                                      stdout=output_log,
+                                      start_new_session=True,
+                                      preexec_fn=_pin_to(cores, command[0]))
+        self.pid = self.popen.pid
+        self.returncode = None
+        self.rusage = None
+        self.exited = threading.Event()
+        threading.Thread(target=self.reap, daemon=True).start()
+
+    def reap(self):
+        status, self.rusage = os.wait4(self.pid, 0)[1:]
+        self.returncode = os.waitstatus_to_exitcode(status)
+        self.popen.returncode = self.returncode  # Popen must not reap it
+        self.exited.set()
+        self.on_exit()
+
+    def on_exit(self):
+        pass
+
+    def wait(self, timeout=None):
+        if not self.exited.wait(timeout):
+            raise subprocess.TimeoutExpired(self.args, timeout)
+        return self.returncode
+
+
+class AsyncChildProcess(ChildProcess):
+    # ChildProcess whose wait is a coroutine, as for asyncio subprocesses.
+    # It must be started from the event loop.
+    def __init__(self, command, output_log, cwd=None, env=None, cores=None):
+        self.loop = asyncio.get_running_loop()
+        self.exit_future = self.loop.create_future()
+        super().__init__(command, output_log, cwd, env, cores)
+
+    def on_exit(self):
+        try:
+            self.loop.call_soon_threadsafe(self.exit_future.set_result,
+                                           self.returncode)
+        except RuntimeError:
+            pass  # The batch stopped before the job exited
+
+    async def wait(self):
+        # Shielded so a wait_for timeout does not cancel the exit itself
+        return await asyncio.shield(self.exit_future)
+
+
+def job_usage(process, wall_time, processors):
+    # Resource usage of an exited job. cpu_efficiency is the share of its
+    # processors' time the job kept busy.
+    if process.rusage is None:
+        return None
+    rusage = process.rusage
+    cpu_time = rusage.ru_utime + rusage.ru_stime
+    cpu_efficiency = None
+    if wall_time and processors:
+        cpu_efficiency = cpu_time / (wall_time * processors)
+    return {"user_cpu": rusage.ru_utime,
+            "system_cpu": rusage.ru_stime,
+            "max_rss_kb": rusage.ru_maxrss,
+            "block_input": rusage.ru_inblock,
+            "block_output": rusage.ru_oublock,
+            "voluntary_switches": rusage.ru_nvcsw,
+            "involuntary_switches": rusage.ru_nivcsw,
+            "cpu_efficiency": cpu_efficiency}
+
+
+def log_usage(name, usage):
+    if usage is None:
+        return
+    logging.info("CPU time: {:.1f} s user, {:.1f} s system. Max RSS: {} MB. "
+                 "Block I/O: {} in, {} out. Context switches: {} voluntary, "
+                 "{} involuntary."
+                 .format(usage["user_cpu"], usage["system_cpu"],
+                         usage["max_rss_kb"] // 1024, usage["block_input"],
+                         usage["block_output"], usage["voluntary_switches"],
+                         usage["involuntary_switches"]))
+    if usage["cpu_efficiency"] is None:
+        return
+    if usage["cpu_efficiency"] < LOW_CPU_EFFICIENCY:
+        logging.warning("{} kept only {:.0%} of its processors busy."
+                        .format(name, usage["cpu_efficiency"]))
+    else:
+        logging.info("CPU efficiency: {:.0%}."
+                     .format(usage["cpu_efficiency"]))
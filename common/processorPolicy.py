@@ -0,0 +1,204 @@
+"""
+This script contains the processor count policy for gamess jobs.
+It is not designed to be run independently.
+
+A cost model is fitted to the successful gamess runs in the results database.
+The wall time of a job on p processors is modelled as
+
+    T(p) = W * (s + (1 - s) / p) + o * (p - 1)
+
+where the work W grows as a power of the number of atoms with a separate
+factor for each basis set, s is the serial fraction of the work and o is the
+overhead of each additional process. The policy gives each job the largest
+processor count whose parallel efficiency T(1) / (p * T(p)) stays above a
+threshold, so small molecules get few processors and large ones many.
+"""
+
+import logging
+import math
+import sqlite3
+
+SERIAL_FRACTIONS = [0.0, 0.01, 0.02, 0.05, 0.1, 0.2, 0.3, 0.5]
+OVERHEADS = [0, 0.5, 1, 2, 5, 10, 30, 60, 120]  # Seconds per extra process
+DEFAULT_SIZE_EXPONENT = 3  # DFT cost scaling used until atom counts vary
+MIN_RUNS = 3  # Runs needed before the model is used
+
+TRAINING_QUERY = ("SELECT atoms, basis_set, processors, wall_time FROM results "
+                  "WHERE program = 'gamess' AND exit_status = 0 AND "
+                  "wall_time > 0 AND processors > 0 AND atoms > 0")
+
+
+def read_input(input_path):
+    # Returns the nuclear charges of the atoms in $DATA and the $BASIS group
+    # of a gamess input, normalized so equal basis sets compare equal
+    charges = []
+    basis_set = ""
+    in_data = False
+    with open(input_path, 'r') as input_file:
+        for line in input_file:
+            upper_line = line.upper()
+            if "$BASIS" in upper_line:
+                basis_set = " ".join(sorted(
+                    upper_line.split("$BASIS")[1].split("$END")[0].split()))
+            elif "$DATA" in upper_line:
+                in_data = True
+            elif in_data and "$END" in upper_line:
+                in_data = False
+            elif in_data:
+                # Atom lines are: name, nuclear charge, x, y, z
+                fields = line.split()
+                if len(fields) >= 5:
+                    try:
+                        charges.append(float(fields[1]))
+                    except ValueError:
+                        pass
+    return charges, basis_set
+
+
+def read_input_features(input_path):
+    # Returns the number of atoms and the basis set of a gamess input
+    try:
+        charges, basis_set = read_input(input_path)
+    except FileNotFoundError:
+        return None, None
+    return len(charges), basis_set
+
+
+def read_electron_count(input_path):
+    # Electrons of the neutral molecule, or None if the input is missing
+    try:
+        charges, basis_set = read_input(input_path)
+    except FileNotFoundError:
+        return None
+    return int(sum(charges))
+
+
+class ProcessorPolicy:
+    def __init__(self, database_name, default_processors, min_processors=1,
+                 max_processors=16, min_efficiency=0.7):
+        self.default_processors = default_processors
+        self.min_processors = min_processors
+        self.max_processors = max_processors
+        self.min_efficiency = min_efficiency
+        self.model = None
+        self.scaling_known = False  # Runs on more than one processor count
+        self.fit(database_name)
+
+    def fit(self, database_name):
+        connection = sqlite3.connect(database_name)
+        try:
+            runs = connection.execute(TRAINING_QUERY).fetchall()
+        except sqlite3.OperationalError:
+            runs = []  # Database written before processors were recorded
+        connection.close()
+        if len(runs) < MIN_RUNS:
+            logging.info("{} past gamess runs found. Using {} processors per "
+                         "job until {} are recorded."
+                         .format(len(runs), self.default_processors, MIN_RUNS))
+            return
+
+        # How the run time scales with processors can only be fitted from runs
+        # on different processor counts
+        self.scaling_known = len({run[2] for run in runs}) > 1
+        if not self.scaling_known:
+            logging.info("All past gamess runs used {} processors. Using {} "
+                         "processors per job until other counts are recorded."
+                         .format(runs[0][2], self.default_processors))
+
+        # Search the serial fraction and overhead; the work is fitted by
+        # least squares for each pair
+        best_error = None
+        for serial_fraction in SERIAL_FRACTIONS:
+            for overhead in OVERHEADS:
+                model = self.fit_work(runs, serial_fraction, overhead)
+                if model is None:
+                    continue
+                error = sum((math.log(self.wall_time(model, atoms, basis_set,
+                                                     processors))
+                             - math.log(wall_time)) ** 2
+                            for atoms, basis_set, processors, wall_time in runs)
+                if best_error is None or error < best_error:
+                    best_error = error
+                    self.model = model
+        if self.model is not None:
+            logging.info("Fitted processor model to {} runs: serial fraction "
+                         "{}, overhead {} s per process, work ~ atoms^{:.2f}."
+                         .format(len(runs), self.model["serial_fraction"],
+                                 self.model["overhead"],
+                                 self.model["exponent"]))
+
+    def fit_work(self, runs, serial_fraction, overhead):
+        # Fits log W = log c_basis + k log atoms with k shared by all basis
+        # sets. Each run is weighted by the share of its wall time spent on
+        # the work, since the work of a run taken up by the overhead is known
+        # poorly. Returns None if no run has any time left for the work.
+        points = {}
+        for atoms, basis_set, processors, wall_time in runs:
+            parallel_time = wall_time - overhead * (processors - 1)
+            if parallel_time <= 0:
+                continue
+            work = parallel_time / \
+                (serial_fraction + (1 - serial_fraction) / processors)
+            weight = (parallel_time / wall_time) ** 2
+            points.setdefault(basis_set, []).append(
+                (math.log(atoms), math.log(work), weight))
+        if not points:
+            return None
+
+        means = {}
+        for basis_set, group in points.items():
+            total_weight = sum(weight for x, y, weight in group)
+            means[basis_set] = (
+                sum(x * weight for x, y, weight in group) / total_weight,
+                sum(y * weight for x, y, weight in group) / total_weight)
+        covariance = 0
+        variance = 0
+        for basis_set, group in points.items():
+            mean_x, mean_y = means[basis_set]
+            for x, y, weight in group:
+                covariance += weight * (x - mean_x) * (y - mean_y)
+                variance += weight * (x - mean_x) ** 2
+        exponent = covariance / variance if variance else DEFAULT_SIZE_EXPONENT
+
+        intercepts = {basis_set: mean_y - exponent * mean_x
+                      for basis_set, (mean_x, mean_y) in means.items()}
+        return {"serial_fraction": serial_fraction,
+                "overhead": overhead,
+                "exponent": exponent,
+                "intercepts": intercepts,
+                "default_intercept": sum(intercepts.values()) / len(intercepts)}
+
+    def wall_time(self, model, atoms, basis_set, processors):
+        intercept = model["intercepts"].get(basis_set,
+                                            model["default_intercept"])
+        work = math.exp(intercept + model["exponent"] * math.log(atoms))
+        serial_fraction = model["serial_fraction"]
+        return work * (serial_fraction + (1 - serial_fraction) / processors) \
+            + model["overhead"] * (processors - 1)
+
+    def predict(self, input_path, processors):
+        # Predicted wall time in seconds, or None without a model
+        atoms, basis_set = read_input_features(input_path)
+        if self.model is None or not atoms:
+            return None
+        return self.wall_time(self.model, atoms, basis_set, processors)
+
+    def processors(self, input_path, log=True):
+        atoms, basis_set = read_input_features(input_path)
+        if self.model is None or not self.scaling_known or not atoms:
+            return self.default_processors
+
+        serial_time = self.wall_time(self.model, atoms, basis_set, 1)
+        chosen = self.min_processors
+        for processors in range(self.min_processors, self.max_processors + 1):
+            wall_time = self.wall_time(self.model, atoms, basis_set,
+                                       processors)
+            if serial_time / (processors * wall_time) >= self.min_efficiency:
+                chosen = processors
+        if log:
+            logging.info("Chose {} processors for {} ({} atoms), predicted "
+                         "run time {:.0f} s."
+                         .format(chosen, input_path, atoms,
+                                 self.wall_time(self.model, atoms, basis_set,
+                                                chosen)))
+        return chosen
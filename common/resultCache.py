@@ -0,0 +1,74 @@
+"""
+This script contains the content-addressed cache of gamess output logs.
+It is not designed to be run independently.
+
+Logs are stored under a hash of the normalized input file and the gamess
+version, so a renamed copy of an input reuses the old log and an edited
+input is always recomputed. The cache is trimmed to a size cap by evicting
+the least recently used logs.
+"""
+
+import hashlib
+import logging
+import os
+
+from fileStaging import stage_file
+
+
+def normalize_input(input_text):
+    # gamess input is case insensitive and ignores spacing and blank lines
+    lines = []
+    for line in input_text.splitlines():
+        line = " ".join(line.split()).upper()
+        if line:
+            lines.append(line)
+    return "\n".join(lines)
+
+
+class ResultCache:
+    def __init__(self, cache_dir, version, max_bytes):
+        self.cache_dir = cache_dir
+        self.version = version
+        self.max_bytes = max_bytes
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def key(self, input_path):
+        with open(input_path, 'r') as input_file:
+            normalized = normalize_input(input_file.read())
+        digest = hashlib.sha256()
+        digest.update(self.version.encode())
+        digest.update(b"\0")
+        digest.update(normalized.encode())
+        return digest.hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.cache_dir, key + ".log")
+
+    def restore(self, key, output_path):
+        # Copies a cached log to output_path. Returns False on a cache miss.
+        cached_path = self.path(key)
+        try:
+            stage_file(cached_path, output_path, link=False)
+        except FileNotFoundError:
+            return False
+        os.utime(cached_path)  # Mark as recently used
+        return True
+
+    def store(self, key, output_path):
+        cached_path = self.path(key)
+        temp_path = cached_path + ".tmp"
+        stage_file(output_path, temp_path, link=False)
+        os.replace(temp_path, cached_path)
+        self.evict()
+
+    def evict(self):
+        with os.scandir(self.cache_dir) as entries:
+            cached = [(entry.stat().st_mtime, entry.stat().st_size, entry.path)
+                      for entry in entries if entry.name.endswith(".log")]
+        total = sum(size for mtime, size, path in cached)
+        for mtime, size, path in sorted(cached):
+            if total <= self.max_bytes:
+                break
+            os.remove(path)
+            total -= size
+            logging.debug("Evicted {} from result cache.".format(path))
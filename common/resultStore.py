@@ -0,0 +1,154 @@
+"""
+This script contains the SQLite result store shared by the batch scripts.
+It is not designed to be run independently.
+
+Every finished GAMESS or Smina job is written as one row of the results
+table. Rows are buffered and written in batches so recording results does
+not slow down the job loop.
+"""
+
+import hashlib
+import sqlite3
+import time
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS results (
+    id INTEGER PRIMARY KEY,
+    batch TEXT,
+    program TEXT,
+    job_id TEXT,
+    input_path TEXT,
+    input_hash TEXT,
+    wall_time REAL,
+    exit_status INTEGER,
+    energy REAL,
+    score REAL,
+    output_path TEXT,
+    finished REAL,
+    processors INTEGER,
+    atoms INTEGER,
+    basis_set TEXT,
+    user_cpu REAL,
+    system_cpu REAL,
+    max_rss_kb INTEGER,
+    block_input INTEGER,
+    block_output INTEGER,
+    voluntary_switches INTEGER,
+    involuntary_switches INTEGER,
+    cpu_efficiency REAL,
+    first_scf_iterations INTEGER,
+    geometry_steps INTEGER,
+    warm_start TEXT
+);
+CREATE INDEX IF NOT EXISTS results_score ON results (score);
+CREATE INDEX IF NOT EXISTS results_exit_status ON results (exit_status);
+CREATE INDEX IF NOT EXISTS results_job_id ON results (job_id);
+"""
+
+# Resource usage of a job (see processUsage)
+USAGE_COLUMNS = [("user_cpu", "REAL"),
+                 ("system_cpu", "REAL"),
+                 ("max_rss_kb", "INTEGER"),
+                 ("block_input", "INTEGER"),
+                 ("block_output", "INTEGER"),
+                 ("voluntary_switches", "INTEGER"),
+                 ("involuntary_switches", "INTEGER"),
+                 ("cpu_efficiency", "REAL")]
+
+# Convergence of a basis set step and the warm start it was given (orbitals,
+# hessian or both, comma separated; empty for a cold start)
+STEP_COLUMNS = [("first_scf_iterations", "INTEGER"),
+                ("geometry_steps", "INTEGER"),
+                ("warm_start", "TEXT")]
+
+# Columns added after the first version of the table
+ADDED_COLUMNS = [("processors", "INTEGER"),
+                 ("atoms", "INTEGER"),
+                 ("basis_set", "TEXT")] + USAGE_COLUMNS + STEP_COLUMNS
+
+INSERT = ("INSERT INTO results (batch, program, job_id, input_path, "
+          "input_hash, wall_time, exit_status, energy, score, output_path, "
+          "finished, processors, atoms, basis_set, {}) "
+          "VALUES ({})".format(", ".join(column for column, column_type
+                                         in USAGE_COLUMNS + STEP_COLUMNS),
+                               ", ".join("?" * (14 + len(USAGE_COLUMNS) +
+                                                len(STEP_COLUMNS)))))
+
+# Mean convergence of warm and cold started steps of each basis set
+WARM_START_QUERY = ("SELECT basis_set, warm_start != '', COUNT(*), "
+                    "AVG(first_scf_iterations), AVG(geometry_steps), "
+                    "AVG(wall_time) FROM results "
+                    "WHERE program = 'gamess' AND exit_status = 0 AND "
+                    "warm_start IS NOT NULL "
+                    "GROUP BY basis_set, warm_start != '' "
+                    "ORDER BY basis_set, warm_start != ''")
+
+
+def file_hash(path):
+    # SHA-256 of a file, read in blocks so large inputs are not loaded whole
+    digest = hashlib.sha256()
+    try:
+        with open(path, 'rb') as hashed_file:
+            for block in iter(lambda: hashed_file.read(1 << 20), b""):
+                digest.update(block)
+    except FileNotFoundError:
+        return None
+    return digest.hexdigest()
+
+
+class ResultStore:
+    def __init__(self, database_name, batch, batch_size=50):
+        self.batch = batch
+        self.batch_size = batch_size
+        self.pending = []
+        self.connection = sqlite3.connect(database_name)
+        self.connection.executescript(SCHEMA)
+        self.add_columns()
+
+    def add_columns(self):
+        # Databases from earlier batches are extended in place
+        columns = {row[1] for row in
+                   self.connection.execute("PRAGMA table_info(results)")}
+        with self.connection:
+            for column, column_type in ADDED_COLUMNS:
+                if column not in columns:
+                    self.connection.execute(
+                        "ALTER TABLE results ADD COLUMN {} {}"
+                        .format(column, column_type))
+
+    def add(self, program, job_id, input_path, wall_time, exit_status,
+            energy=None, score=None, output_path=None, input_hash=None,
+            processors=None, atoms=None, basis_set=None, usage=None,
+            first_scf_iterations=None, geometry_steps=None, warm_start=None):
+        # usage is the job's resource usage from processUsage.job_usage
+        if input_hash is None:
+            input_hash = file_hash(input_path)
+        if usage is None:
+            usage = {}
+        self.pending.append((self.batch, program, job_id, input_path,
+                             input_hash, wall_time, exit_status, energy,
+                             score, output_path, time.time(), processors,
+                             atoms, basis_set) +
+                            tuple(usage.get(column)
+                                  for column, column_type in USAGE_COLUMNS) +
+                            (first_scf_iterations, geometry_steps, warm_start))
+        if len(self.pending) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if not self.pending:
+            return
+        with self.connection:
+            self.connection.executemany(INSERT, self.pending)
+        self.pending = []
+
+    def warm_start_savings(self):
+        # Returns (basis set, warm, steps, mean first SCF iterations, mean
+        # geometry steps, mean wall time) for the warm and cold started steps
+        # of every basis set in the database
+        self.flush()
+        return self.connection.execute(WARM_START_QUERY).fetchall()
+
+    def close(self):
+        self.flush()
+        self.connection.close()
@@ -0,0 +1,134 @@
+"""
+This script contains the manager for the gamess scratch directories.
+It is not designed to be run independently.
+
+Each scratch directory is scanned once per batch and its files are indexed
+by the job they belong to, so cleaning up before a job only touches the files
+of that job. Residual files of queued jobs are deleted by a background thread
+while other jobs run; a job only waits for the deletion of its own files. The
+files of a job the batch has already run are not in the index, so a job run
+again by the same process, such as a distributed job whose lease expired, has
+the directories searched again for its own files.
+
+When a scratch root is given, each job instead runs in a private directory
+created under it, holding the job's input, output log and the SCR and USERSCR
+directories passed to rungms. Supplemental output is harvested from USERSCR
+when the job finishes and the directory is then deleted in the background.
+"""
+
+import concurrent.futures
+import logging
+import os
+import shutil
+import tempfile
+
+from fileStaging import stage_file
+
+
+def job_key(file_name):
+    # gamess names scratch files after the job, e.g. job.F05 or job.dat
+    return file_name.split(".")[0]
+
+
+class ScratchManager:
+    def __init__(self, directories, scratch_root=""):
+        self.directories = directories  # List of (path, description)
+        self.scratch_root = scratch_root
+        if scratch_root:
+            # Roots left by an interrupted batch are cleaned up with their job
+            self.directories = directories + [(scratch_root, "scratch root")]
+        self.index = None  # Residual files of each job, built on first use
+        self.cleaned = set()  # Jobs cleaned up to run since the scan
+        self.pending = {}  # Background deletion of each job's files
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+
+    def scan(self):
+        self.index = {}
+        number_of_files = 0
+        if self.scratch_root:
+            os.makedirs(self.scratch_root, exist_ok=True)
+        for directory, description in self.directories:
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    self.index.setdefault(job_key(entry.name), []).append(
+                        (entry.name, entry.path, description))
+                    number_of_files += 1
+        logging.debug("Indexed {} files in scratch directories."
+                      .format(number_of_files))
+
+    def rescan(self, job_name):
+        # Adds the files written since the scan by an earlier run of job_name
+        files = self.index.setdefault(job_key(job_name), [])
+        for directory, description in self.directories:
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    file = (entry.name, entry.path, description)
+                    if ((entry.name == job_name
+                         or entry.name.startswith(job_name + "."))
+                            and file not in files):
+                        files.append(file)
+
+    def residuals(self, job_name):
+        # Removes and returns the indexed files belonging to exactly job_name
+        if self.index is None:
+            self.scan()
+        elif job_name in self.cleaned:
+            self.rescan(job_name)
+        self.cleaned.add(job_name)
+        key = job_key(job_name)
+        files = self.index.get(key, [])
+        matched = [file for file in files
+                   if file[0] == job_name or file[0].startswith(job_name + ".")]
+        self.index[key] = [file for file in files if file not in matched]
+        return matched
+
+    def delete(self, files):
+        for file, path, description in files:
+            try:
+                if os.path.isdir(path):
+                    shutil.rmtree(path)
+                else:
+                    os.remove(path)
+                logging.warning("Removed {} from {}.".format(file, description))
+            except FileNotFoundError:
+                pass
+
+    def schedule(self, job_name):
+        # Starts deleting a job's residual files in the background
+        if job_name not in self.pending:
+            self.pending[job_name] = self.executor.submit(
+                self.delete, self.residuals(job_name))
+
+    def clean(self, job_name):
+        # Returns once all residual files of the job are deleted
+        self.schedule(job_name)
+        self.pending.pop(job_name).result()
+
+    def create_root(self, job_name):
+        # Returns a new private directory for the job and the SCR and USERSCR
+        # directories inside it
+        os.makedirs(self.scratch_root, exist_ok=True)
+        job_root = tempfile.mkdtemp(prefix=job_name + ".",
+                                    dir=self.scratch_root)
+        scr = os.path.join(job_root, "scr")
+        userscr = os.path.join(job_root, "userscr")
+        os.mkdir(scr)
+        os.mkdir(userscr)
+        return job_root, scr, userscr
+
+    def harvest(self, job_root, supp_output_dir):
+        # Moves the job's supplemental output (.dat, .rst, .trj, ...) to
+        # supp_output_dir and deletes the rest of the root in the background
+        with os.scandir(os.path.join(job_root, "userscr")) as entries:
+            for entry in entries:
+                stage_file(entry.path,
+                           os.path.join(supp_output_dir, entry.name), move=True)
+                logging.debug("Harvested {} to supplemental output directory."
+                              .format(entry.name))
+        self.remove_root(job_root)
+
+    def remove_root(self, job_root):
+        self.executor.submit(shutil.rmtree, job_root, True)
+
+    def close(self):
+        self.executor.shutdown(wait=True)
@@ -0,0 +1,92 @@
+"""
+This script contains the Smina job runner used by the Smina batch script.
+It is not designed to be run independently.
+
+SminaRunner is the Smina backend of the asyncRunner pipeline. Compounds are
+docked where they are, so staging only names the job's outputs, and each job
+is pinned to the processors it was given.
+"""
+
+import logging
+import os
+import time
+
+from asyncRunner import start_process
+from batchMetrics import timed
+from processUsage import job_usage, log_usage
+
+
+def compound_name(test_compound):
+    return os.path.basename(test_compound).split(".sdf")[0]
+
+
+def build_smina_command(executable, test_compound, protein_ligand, ligand,
+                        output_name, cpu=None):
+    flex_distance = 3.5
+    seed = 0
+    exhaustiveness = 32
+    scoring = "vinardo"
+
+    command = ["./" + executable,
+               "--receptor", protein_ligand,
+               "--ligand", test_compound,
+               "--flexdist", str(flex_distance),
+               "--flexdist_ligand", ligand,
+               "--autobox_ligand", ligand,
+               "--scoring", scoring,
+               "--out", output_name,
+               "--seed", str(seed),
+               "--exhaustiveness", str(exhaustiveness)]
+    if cpu is not None:
+        command += ["--cpu", str(cpu)]
+    return command
+
+
+class SminaRunner:
+    name = "Smina"
+
+    def __init__(self, executable, protein_ligand, ligand, output_dir):
+        self.executable = executable
+        self.protein_ligand = protein_ligand
+        self.ligand = ligand
+        self.output_dir = output_dir
+        self.processor_policy = None
+
+    def prepare(self, test_compounds):
+        pass  # Smina leaves no scratch files behind
+
+    def processors_for(self, test_compound, default):
+        return default
+
+    def stage_job(self, test_compound):
+        name = compound_name(test_compound)
+        return {"input_file": test_compound,
+                "output_name": os.path.join(self.output_dir,
+                                            name + "_output.sdf"),
+                "output_log_name": os.path.join(self.output_dir, name + ".log"),
+                "timings": {}}
+
+    async def execute_job(self, job, number_of_processors, monitor_interval):
+        # Docks one compound. monitor_interval is unused; Smina jobs are
+        # not monitored.
+        logging.info("Beginning Smina process.")
+        job["start_time"] = time.time()
+        command = build_smina_command(self.executable, job["input_file"],
+                                      self.protein_ligand, self.ligand,
+                                      job["output_name"], number_of_processors)
+        with open(job["output_log_name"], 'w') as output_log:
+            with timed(job["timings"], "spawn"):
+                job["process"] = await start_process(command, output_log,
+                                                     cores=job["cores"])
+            job["exit_status"] = await job["process"].wait()
+        job["wall_time"] = time.time() - job["start_time"]
+        job["usage"] = job_usage(job["process"], job["wall_time"],
+                                 number_of_processors)
+        logging.info("Smina process complete.")
+        log_usage("Smina job for {}".format(job["input_file"]), job["usage"])
+
+    def finish_job(self, job):
+        pass  # Poses and logs are written straight to the output directory
+
+    def fail_job(self, job):
+        pass  # The compound is not journaled as docked, so it is redocked
@@ -0,0 +1,231 @@
+"""
+This script contains the distributed work queue used by the gamess
+coordinator and workers.
+It is not designed to be run independently.
+
+The queue is a SQLite table of jobs. A worker leases the next queued job and
+must renew the lease with heartbeats while the job runs; a lease that is not
+renewed expires and its job is queued again, so the jobs of a worker that
+died are picked up by the others. Workers reach the queue either by opening
+the same SQLite file on a shared filesystem or through the coordinator over
+TCP, where each request and reply is one JSON line.
+"""
+
+import json
+import logging
+import re
+import socket
+import socketserver
+import sqlite3
+import threading
+import time
+
+from jobJournal import DONE, FAILED, QUEUED
+
+LEASED = "leased"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    job TEXT PRIMARY KEY,
+    priority INTEGER,
+    state TEXT,
+    worker TEXT,
+    lease_expires REAL,
+    attempts INTEGER DEFAULT 0,
+    exit_status INTEGER,
+    wall_time REAL,
+    processors INTEGER,
+    finished REAL,
+    recorded INTEGER DEFAULT 0,
+    usage TEXT
+);
+CREATE INDEX IF NOT EXISTS jobs_state ON jobs (state, priority);
+"""
+
+TCP_ADDRESS = re.compile(r"^([\w.-]+):(\d+)$")
+CONNECT_ATTEMPTS = 5  # Tries before a worker gives up on the coordinator
+
+
+class WorkQueue:
+    def __init__(self, database_name, lease_seconds=300, max_attempts=3):
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.lock = threading.Lock()  # The TCP server calls from threads
+        self.connection = sqlite3.connect(database_name, timeout=60,
+                                          isolation_level=None,
+                                          check_same_thread=False)
+        self.connection.executescript(SCHEMA)
+        columns = {row[1] for row in
+                   self.connection.execute("PRAGMA table_info(jobs)")}
+        if "usage" not in columns:
+            # Queues from earlier batches are extended in place
+            self.connection.execute("ALTER TABLE jobs ADD COLUMN usage TEXT")
+
+    def transaction(self, *statements):
+        # Runs (sql, parameters) statements in one write transaction, so
+        # workers sharing the database file never lease the same job
+        with self.lock:
+            self.connection.execute("BEGIN IMMEDIATE")
+            try:
+                results = [self.connection.execute(sql, parameters).fetchall()
+                           for sql, parameters in statements]
+                self.connection.execute("COMMIT")
+            except BaseException:
+                self.connection.execute("ROLLBACK")
+                raise
+        return results
+
+    def expire_leases(self):
+        # Statements returning jobs with expired leases to the queue, or
+        # failing them once they have been tried max_attempts times
+        now = time.time()
+        return [("UPDATE jobs SET state = ?, worker = NULL WHERE state = ? "
+                 "AND lease_expires < ? AND attempts >= ?",
+                 (FAILED, LEASED, now, self.max_attempts)),
+                ("UPDATE jobs SET state = ?, worker = NULL WHERE state = ? "
+                 "AND lease_expires < ?", (QUEUED, LEASED, now))]
+
+    def add(self, jobs):
+        # Jobs already in the queue keep their state
+        self.transaction(*[("INSERT OR IGNORE INTO jobs (job, priority, state) "
+                            "VALUES (?, ?, ?)", (job, priority, QUEUED))
+                           for priority, job in enumerate(jobs)])
+
+    def lease(self, worker):
+        # Returns the next queued job, now leased to worker, or None
+        now = time.time()
+        results = self.transaction(
+            *self.expire_leases(),
+            ("UPDATE jobs SET state = ?, worker = ?, lease_expires = ?, "
+             "attempts = attempts + 1 WHERE job = (SELECT job FROM jobs "
+             "WHERE state = ? ORDER BY priority LIMIT 1)",
+             (LEASED, worker, now + self.lease_seconds, QUEUED)),
+            ("SELECT job FROM jobs WHERE state = ? AND worker = ? AND "
+             "lease_expires = ?", (LEASED, worker, now + self.lease_seconds)))
+        rows = results[-1]
+        return rows[0][0] if rows else None
+
+    def heartbeat(self, worker, job):
+        # Renews the lease. Returns False if the worker no longer holds it.
+        results = self.transaction(
+            ("UPDATE jobs SET lease_expires = ? WHERE job = ? AND "
+             "state = ? AND worker = ?",
+             (time.time() + self.lease_seconds, job, LEASED, worker)),
+            ("SELECT changes()", ()))
+        return results[-1][0][0] == 1
+
+    def complete(self, worker, job, succeeded, exit_status, wall_time,
+                 processors, usage=None):
+        # Records the result if the worker still holds the lease. usage is
+        # the job's resource usage from processUsage.job_usage.
+        results = self.transaction(
+            ("UPDATE jobs SET state = ?, exit_status = ?, wall_time = ?, "
+             "processors = ?, finished = ?, usage = ? WHERE job = ? AND "
+             "state = ? AND worker = ?",
+             (DONE if succeeded else FAILED, exit_status, wall_time,
+              processors, time.time(), json.dumps(usage), job, LEASED,
+              worker)),
+            ("SELECT changes()", ()))
+        return results[-1][0][0] == 1
+
+    def counts(self):
+        # Number of jobs in each state
+        results = self.transaction(
+            *self.expire_leases(),
+            ("SELECT state, COUNT(*) FROM jobs GROUP BY state", ()))
+        return dict(results[-1])
+
+    def finished_jobs(self):
+        # Finished jobs not yet recorded, which are marked as recorded
+        results = self.transaction(
+            ("SELECT job, state, worker, exit_status, wall_time, processors, "
+             "usage FROM jobs WHERE state IN (?, ?) AND recorded = 0 AND "
+             "finished IS NOT NULL", (DONE, FAILED)),
+            ("UPDATE jobs SET recorded = 1 WHERE state IN (?, ?) AND "
+             "finished IS NOT NULL", (DONE, FAILED)))
+        return [row[:-1] + (json.loads(row[-1] or "null"),)
+                for row in results[0]]
+
+    def close(self):
+        self.connection.close()
+
+
+class QueueRequestHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        for line in self.rfile:
+            try:
+                request = json.loads(line)
+                method = request.pop("method")
+                if method not in ("lease", "heartbeat", "complete", "counts"):
+                    raise ValueError("Unknown method {}".format(method))
+                reply = {"result": getattr(self.server.queue, method)(
+                    **request)}
+            except (ValueError, TypeError, KeyError) as error:
+                reply = {"error": str(error)}
+            self.wfile.write((json.dumps(reply) + "\n").encode())
+
+
+class QueueServer(socketserver.ThreadingTCPServer):
+    # Serves a WorkQueue to workers on other nodes
+    allow_reuse_address = True
+    daemon_threads = True
+
+    def __init__(self, queue, host, port):
+        self.queue = queue
+        super().__init__((host, port), QueueRequestHandler)
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        logging.info("Serving work queue on {}:{}.".format(host, port))
+
+
+class QueueClient:
+    # Offers the WorkQueue methods used by workers over TCP
+    def __init__(self, host, port, retry_interval=5):
+        self.address = (host, port)
+        self.retry_interval = retry_interval
+
+    def call(self, method, **arguments):
+        arguments["method"] = method
+        for attempt in range(CONNECT_ATTEMPTS):
+            try:
+                with socket.create_connection(self.address, timeout=60) \
+                        as connection:
+                    connection.sendall((json.dumps(arguments) + "\n").encode())
+                    reply = json.loads(connection.makefile('r').readline())
+                break
+            except (OSError, ValueError) as error:
+                logging.warning("Coordinator at {}:{} not reachable: {}."
+                                .format(*self.address, error))
+                if attempt == CONNECT_ATTEMPTS - 1:
+                    raise
+                time.sleep(self.retry_interval)
+        if "error" in reply:
+            raise ValueError(reply["error"])
+        return reply["result"]
+
+    def lease(self, worker):
+        return self.call("lease", worker=worker)
+
+    def heartbeat(self, worker, job):
+        return self.call("heartbeat", worker=worker, job=job)
+
+    def complete(self, worker, job, succeeded, exit_status, wall_time,
+                 processors, usage=None):
+        return self.call("complete", worker=worker, job=job,
+                         succeeded=succeeded, exit_status=exit_status,
+                         wall_time=wall_time, processors=processors,
+                         usage=usage)
+
+    def counts(self):
+        return self.call("counts")
+
+    def close(self):
+        pass
+
+
+def connect_queue(address, lease_seconds=300, max_attempts=3):
+    # "host:port" connects to a coordinator over TCP; anything else is the
+    # path of a queue database on a shared filesystem
+    tcp_address = TCP_ADDRESS.match(address)
+    if tcp_address is not None:
+        return QueueClient(tcp_address.group(1), int(tcp_address.group(2)))
+    return WorkQueue(address, lease_seconds, max_attempts)
@@ -5,95 +5,121 @@ Last updated : 22NOV2017
 
 This script is designed to run all gamess .inp files in the directory from
 which the script is run. It will not double-process data if a .log file for the
-data set is present.
+data set is present or the job journal (JOURNAL_FILE) records it as done. When
+CACHE_DIR is set, inputs are instead matched by their contents against
+previously computed logs, which are restored without rerunning gamess.
+
+Setting CORE_BUDGET runs several jobs at once, splitting the given number of
+processors between them. Jobs run under asyncio, so the next input is staged
+while jobs run and each job's output is harvested as soon as it exits. The
+log of each running job is followed and its progress written to the batch
+log; MAX_SCF_ITERATIONS and MAX_STALLED_STEPS kill jobs that stop converging.
+
+Jobs are started longest first, ranked by run times predicted from earlier
+batches in RESULTS_DATABASE or, before there are any, by electron count.
+
+The time each job spends in every stage of the batch is written to
+METRICS_FILE as JSON lines and, when PROMETHEUS_FILE is set, totalled in a
+Prometheus text file for node_exporter.
 
 To run this script:
 sudo python3 gamessBatchRun.py
 In linux, always run this script as a superuser (su or sudo).
 """
 
-import datetime
 import logging
 import os
-import shutil
-import subprocess
+import sys
 import time
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             os.pardir, os.pardir, "common"))
+from asyncRunner import run_batch
+from batchLog import start_batch_log
+from batchMetrics import BatchMetrics, timed
+from gamessJob import GamessRunner
+from gamessLog import exited_gracefully, read_final_energy
+from gamessMonitor import ConvergencePolicy
+from jobJournal import DONE, QUEUED, JobJournal
+from jobOrder import order_longest_first, predict_makespan
+from processorPolicy import ProcessorPolicy, read_input_features
+from resultCache import ResultCache
+from resultStore import ResultStore
+
 # Constants that should be edited based on your system
 PATH_TO_GAMESS = "/home/asher/Programs/gamess/"  # Full path to gamess folder
 TEMP_BINARY_DIR = "/scr/asher/"  # Directory for binary output files
 SUPP_OUTPUT_DIR = "/home/asher/scr/"  # Directory for supplemental output files
 VERSION = "01"  # Version number for gamess
-DATETIME = datetime.datetime.now().strftime("%Y-%m-%d %H_%M_%S")
-
-
-def process_data(input_file, number_of_processors=4):
-    name = input_file.split("Input.inp")[0]
-    output_name = name + "Output.log"
-
-    input_directory = os.getcwd()
-
-    # Copy input file to gamess directory
-    try:
-        logging.debug("Copying input data file to gamess directory.")
-        shutil.copyfile(os.path.join(input_directory, input_file),
-                        os.path.join(PATH_TO_GAMESS, input_file))
-    except FileNotFoundError:
-        logging.error("{} not found in gamess directory. Moving to next file.")
+NUMBER_OF_PROCESSORS = 4  # Processors for each job when running one at a time
+CORE_BUDGET = 0  # Total processors for concurrent jobs (0 runs one at a time)
+MIN_PROCESSORS_PER_JOB = 2  # Smallest processor count given to a concurrent job
+RESULTS_DATABASE = "results.db"  # SQLite file for job results ("" to disable)
+MONITOR_INTERVAL = 60  # Seconds between reads of a running job's log
+MAX_SCF_ITERATIONS = 0  # Kill jobs whose SCF runs longer than this (0 to allow)
+MAX_STALLED_STEPS = 0  # Kill jobs whose energy stalls this many steps (0 to allow)
+KILL_UNCONVERGED_SCF = False  # Kill jobs that report an unconverged SCF
+JOURNAL_FILE = "batch_journal.jsonl"  # Job state journal ("" to disable)
+CACHE_DIR = ""  # Directory for cached output logs ("" to disable)
+CACHE_MAX_BYTES = 10 * 1024 ** 3  # Size limit for the output log cache
+SCRATCH_ROOT = ""  # Directory for private per-job scratch ("" to share)
+ADAPTIVE_PROCESSORS = False  # Choose processors per job from RESULTS_DATABASE
+MAX_PROCESSORS_PER_JOB = 16  # Largest processor count chosen for a job
+MIN_PARALLEL_EFFICIENCY = 0.7  # Lowest parallel efficiency worth more cores
+METRICS_FILE = "batch_metrics.jsonl"  # Stage timings of each job ("" to disable)
+PROMETHEUS_FILE = ""  # Prometheus text file of stage timings ("" to disable)
+
+RUNNER = GamessRunner(PATH_TO_GAMESS, TEMP_BINARY_DIR, SUPP_OUTPUT_DIR, VERSION,
+                      ConvergencePolicy(MAX_SCF_ITERATIONS, MAX_STALLED_STEPS,
+                                        KILL_UNCONVERGED_SCF),
+                      scratch_root=SCRATCH_ROOT)
+
+
+def record_result(result_store, job):
+    if result_store is None or job is None:
         return
-
-    os.chdir(PATH_TO_GAMESS)
-
-    # Check for and remove all residual files from previous gamess runs
-    supp_out_files = os.listdir(SUPP_OUTPUT_DIR)
-    for file in supp_out_files:
-        if file.startswith(name):
-            os.remove(os.path.join(SUPP_OUTPUT_DIR, file))
-            logging.warning("Removed {} from supplemental output directory."
-                            .format(file))
-
-    temp_binary_files = os.listdir(TEMP_BINARY_DIR)
-    for file in temp_binary_files:
-        if file.startswith(name):
-            os.remove(os.path.join(TEMP_BINARY_DIR, file))
-            logging.warning("Removed {} from temporary binary directory."
-                            .format(file))
-
-    # Run gamess job
-    logging.info("Beginning gamess process.")
-    output_log = open(output_name, 'w')
-    subprocess.call(["./rungms", input_file, VERSION,
-                     str(number_of_processors)], stdout=output_log)
-    output_log.close()
-    logging.info("gamess process complete.")
-
-    # Clean up files from run and copy output to input directory
-    try:
-        os.remove(os.path.join(PATH_TO_GAMESS, input_file))
-        shutil.copyfile(os.path.join(PATH_TO_GAMESS, output_name),
-                        os.path.join(input_directory, output_name))
-        logging.info("Output file copied to starting directory.")
-        os.remove(os.path.join(PATH_TO_GAMESS, output_name))
-    except FileNotFoundError:
-        logging.warning("Output file not found.")
-    finally:
-        os.chdir(input_directory)  # Return to input directory for next job
+    input_path = os.path.join(job["input_directory"], job["input_file"])
+    output_path = os.path.join(job["input_directory"], job["output_name"])
+    atoms, basis_set = read_input_features(input_path)
+    with timed(job["timings"], "parse"):
+        energy = read_final_energy(output_path)
+    result_store.add("gamess", job["input_file"].split(".inp")[0], input_path,
+                     job["wall_time"], job["exit_status"], energy=energy,
+                     output_path=output_path,
+                     processors=job["number_of_processors"], atoms=atoms,
+                     basis_set=basis_set, usage=job["usage"])
+
+
+def cache_output(result_cache, job):
+    # Only logs from successful runs are reused
+    if result_cache is None or job is None:
+        return
+    output_path = os.path.join(job["input_directory"], job["output_name"])
+    with timed(job["timings"], "parse"):
+        succeeded = job["exit_status"] == 0 and exited_gracefully(output_path)
+    if not succeeded:
+        return
+    key = result_cache.key(os.path.join(job["input_directory"],
+                                        job["input_file"]))
+    result_cache.store(key, output_path)
 
 
-def main():
-    # Set up log file for batch process.
-    # NOTE: this is different than the gamess .log files.
-    log_filename = DATETIME + ".log"
+def restore_cached(data_sets, result_cache):
+    # Restores output logs of inputs that were already computed and returns
+    # the inputs that still have to be run
+    remaining = []
+    for input_file in data_sets:
+        output_name = input_file.split("Input.inp")[0] + "Output.log"
+        if result_cache.restore(result_cache.key(input_file), output_name):
+            logging.info("{} found in result cache. Restored {}."
+                         .format(input_file, output_name))
+        else:
+            remaining.append(input_file)
+    return remaining
 
-    file_out = logging.FileHandler(log_filename)
-    console_out = logging.StreamHandler()
-    handlers = [file_out, console_out]
-    logging.basicConfig(level=logging.INFO,
-                        format='%(asctime)s: %(levelname)s: %(message)s',
-                        handlers=handlers)
 
-    logging.info("Beginning log for batch started {}."
-                 .format(DATETIME.replace("_", ":")))
+def main():
+    batch_time = start_batch_log()
 
     # Read all files in working directory
     data_sets = []
@@ -108,29 +134,86 @@ def main():
             processed_data_sets.append(file)
     logging.debug("Input read complete.")
 
-    # Check to see if file was processed (check .inp against .log)
-    for data_set in data_sets:
-        if (data_set.split(".inp")[0] + ".log") in processed_data_sets:
-            data_sets.remove(data_set)
-            logging.info("{} already processed. Removing from queue."
-                         .format(data_set))
-    data_sets.sort()
+    journal = None
+    if JOURNAL_FILE:
+        journal = JobJournal(JOURNAL_FILE)
+        RUNNER.journal = journal
+
+    result_cache = None
+    if CACHE_DIR:
+        # Check the cache by input contents instead of by log file name
+        result_cache = ResultCache(CACHE_DIR, VERSION, CACHE_MAX_BYTES)
+        data_sets = restore_cached(data_sets, result_cache)
+    else:
+        # Check to see if file was processed. The journal is checked first;
+        # inputs it has no record of are checked .inp against .log.
+        for data_set in data_sets[:]:
+            state = None if journal is None else journal.state(data_set)
+            if state == DONE or (state is None and
+                                 (data_set.split(".inp")[0] + ".log")
+                                 in processed_data_sets):
+                data_sets.remove(data_set)
+                logging.info("{} already processed. Removing from queue."
+                             .format(data_set))
     logging.debug("Processed files removed from queue.")
 
-    # Run each unprocessed input file
-    for input_file in data_sets:
-        logging.info("Beginning gamess job for {}."
-                     .format(input_file))
-
-        start_time = time.time()
-        process_data(input_file, 4)
-        end_time = time.time()
-
-        logging.info("gamess job for {} complete.".format(input_file))
-        logging.info("Run time: {} hours.".
-                     format((end_time - start_time) / (60 * 60)))
+    # Past run times predict the cost of each job
+    cost_model = None
+    result_store = None
+    if RESULTS_DATABASE:
+        cost_model = ProcessorPolicy(
+            RESULTS_DATABASE, NUMBER_OF_PROCESSORS, MIN_PROCESSORS_PER_JOB,
+            MAX_PROCESSORS_PER_JOB, MIN_PARALLEL_EFFICIENCY)
+        if ADAPTIVE_PROCESSORS:
+            RUNNER.processor_policy = cost_model
+        result_store = ResultStore(RESULTS_DATABASE, batch_time)
+
+    metrics = None
+    if METRICS_FILE or PROMETHEUS_FILE:
+        metrics = BatchMetrics(METRICS_FILE, PROMETHEUS_FILE, batch_time)
+
+    # Start the longest jobs first so the batch does not end on one long job
+    data_sets = order_longest_first(data_sets, cost_model)
+    logging.debug("Queue ordered longest job first.")
+    if journal is not None:
+        for data_set in data_sets:
+            journal.record(data_set, QUEUED)
+    predicted_makespan = predict_makespan(RUNNER, cost_model, data_sets,
+                                          CORE_BUDGET, MIN_PROCESSORS_PER_JOB,
+                                          NUMBER_OF_PROCESSORS)
+    if predicted_makespan is not None:
+        logging.info("Predicted batch run time: {} hours."
+                     .format(predicted_makespan / (60 * 60)))
+    batch_start_time = time.time()
+
+    # Run each unprocessed input file, staging the next while jobs run
+    if CORE_BUDGET:
+        logging.info("Running jobs concurrently on {} processors."
+                     .format(CORE_BUDGET))
+
+    def on_complete(job):
+        record_result(result_store, job)
+        cache_output(result_cache, job)
 
+    try:
+        run_batch(RUNNER, data_sets, CORE_BUDGET, MIN_PROCESSORS_PER_JOB,
+                  MONITOR_INTERVAL, on_complete, NUMBER_OF_PROCESSORS, metrics)
+
+        batch_end_time = time.time()
+        logging.info("Batch run time: {} hours (predicted {}).".format(
+            (batch_end_time - batch_start_time) / (60 * 60),
+            "unknown" if predicted_makespan is None else
+            "{} hours".format(predicted_makespan / (60 * 60))))
+    finally:
+        if result_store is not None:
+            result_store.close()
+        if journal is not None:
+            journal.close()
+        if metrics is not None:
+            metrics.close()
+        RUNNER.close()
     logging.info("Batch process complete.")
 
 
-main()
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+#!/usr/bin/python3
+"""
+This script holds the queue of a gamess batch run by several workstations.
+It queues all gamess .inp files in the directory from which the script is
+run, except those with a .log file, and records the results returned by the
+workers (gamessWorker.py) until every job has finished.
+
+The input directory must be on a filesystem shared by all workstations, at
+the same path on each. Workers reach the queue through this script over TCP
+(COORDINATOR_PORT) or, if COORDINATOR_PORT is 0, by opening QUEUE_DATABASE
+themselves. Jobs whose worker stops sending heartbeats are queued again.
+
+To run this script:
+python3 gamessCoordinator.py
+"""
+
+import logging
+import os
+import sys
+import time
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             os.pardir, os.pardir, "common"))
+from batchLog import start_batch_log
+from gamessLog import read_final_energy
+from jobJournal import DONE, QUEUED
+from jobOrder import order_longest_first
+from processorPolicy import ProcessorPolicy, read_input_features
+from resultStore import ResultStore
+from workQueue import LEASED, QueueServer, WorkQueue
+
+# Constants that should be edited based on your system
+QUEUE_DATABASE = "work_queue.db"  # SQLite file holding the job queue
+COORDINATOR_HOST = "0.0.0.0"  # Interface the coordinator listens on
+COORDINATOR_PORT = 5155  # TCP port for workers (0 to share QUEUE_DATABASE)
+LEASE_SECONDS = 300  # Seconds a job stays leased without a heartbeat
+MAX_ATTEMPTS = 3  # Leases of a job before it is marked as failed
+POLL_INTERVAL = 30  # Seconds between checks for finished jobs
+RESULTS_DATABASE = "results.db"  # SQLite file for job results ("" to disable)
+NUMBER_OF_PROCESSORS = 4  # Processors per job assumed when ordering the queue
+
+
+def record_results(queue, result_store):
+    for job, state, worker, exit_status, wall_time, processors, usage \
+            in queue.finished_jobs():
+        input_directory, input_file = os.path.split(job)
+        output_path = os.path.join(
+            input_directory, input_file.split("Input.inp")[0] + "Output.log")
+        logging.info("{} {} on {} in {} hours."
+                     .format(input_file, state, worker, wall_time / (60 * 60)))
+        if result_store is None:
+            continue
+        atoms, basis_set = read_input_features(job)
+        result_store.add("gamess", input_file.split(".inp")[0], job,
+                         wall_time, exit_status,
+                         energy=read_final_energy(output_path),
+                         output_path=output_path, processors=processors,
+                         atoms=atoms, basis_set=basis_set, usage=usage)
+    if result_store is not None:
+        result_store.flush()
+
+
+def main():
+    batch_time = start_batch_log()
+
+    # Queue every input file without a log
+    input_dir_list = os.listdir(os.getcwd())
+    data_sets = [file for file in input_dir_list if file.endswith(".inp") and
+                 file.split("Input.inp")[0] + "Output.log" not in input_dir_list
+                 and file.split(".inp")[0] + ".log" not in input_dir_list]
+
+    cost_model = None
+    result_store = None
+    if RESULTS_DATABASE:
+        cost_model = ProcessorPolicy(RESULTS_DATABASE, NUMBER_OF_PROCESSORS)
+        result_store = ResultStore(RESULTS_DATABASE, batch_time)
+    data_sets = order_longest_first(data_sets, cost_model)
+
+    queue = WorkQueue(QUEUE_DATABASE, LEASE_SECONDS, MAX_ATTEMPTS)
+    queue.add([os.path.abspath(data_set) for data_set in data_sets])
+    logging.info("{} jobs queued.".format(queue.counts().get(QUEUED, 0)))
+
+    server = None
+    if COORDINATOR_PORT:
+        server = QueueServer(queue, COORDINATOR_HOST, COORDINATOR_PORT)
+
+    try:
+        # Record results until no job is queued or leased
+        while True:
+            record_results(queue, result_store)
+            counts = queue.counts()
+            if not counts.get(QUEUED) and not counts.get(LEASED):
+                break
+            logging.info("{} jobs queued, {} running, {} done."
+                         .format(counts.get(QUEUED, 0), counts.get(LEASED, 0),
+                                 counts.get(DONE, 0)))
+            time.sleep(POLL_INTERVAL)
+        record_results(queue, result_store)
+    finally:
+        if server is not None:
+            server.shutdown()
+            server.server_close()
+        logging.info("Final job states: {}.".format(queue.counts()))
+        queue.close()
+        if result_store is not None:
+            result_store.close()
+    logging.info("Batch process complete.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+#!/usr/bin/python3
+"""
+This script runs gamess jobs leased from the queue of gamessCoordinator.py.
+Start one on each workstation that should take part in the batch; several
+can run on one workstation if it has the processors for them, with
+SCRATCH_ROOT set so that their jobs never share files.
+
+Each job's lease is renewed with a heartbeat while it runs. If the lease is
+lost (because the coordinator gave the job to another worker) the job is
+killed. The worker exits once the queue has no jobs left.
+
+The time each job spends in every stage is written to METRICS_FILE as JSON
+lines and, when PROMETHEUS_FILE is set, totalled in a Prometheus text file
+for node_exporter.
+
+To run this script:
+sudo python3 gamessWorker.py [coordinator]
+where coordinator is host:port of the coordinator or the path of its queue
+database on a shared filesystem (default COORDINATOR).
+In linux, always run this script as a superuser (su or sudo).
+"""
+
+import logging
+import os
+import socket
+import sys
+import time
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             os.pardir, os.pardir, "common"))
+from batchLog import start_batch_log
+from batchMetrics import BatchMetrics, timed
+from gamessJob import GamessRunner
+from gamessLog import exited_gracefully
+from gamessMonitor import ConvergencePolicy, watch_job
+from jobJournal import QUEUED
+from workQueue import LEASED, connect_queue
+
+# Constants that should be edited based on your system
+PATH_TO_GAMESS = "/home/asher/Programs/gamess/"  # Full path to gamess folder
+TEMP_BINARY_DIR = "/scr/asher/"  # Directory for binary output files
+SUPP_OUTPUT_DIR = "/home/asher/scr/"  # Directory for supplemental output files
+VERSION = "01"  # Version number for gamess
+NUMBER_OF_PROCESSORS = 4  # Processors for each job
+COORDINATOR = "localhost:5155"  # host:port or shared queue database path
+LEASE_SECONDS = 300  # Must match the coordinator when sharing the database
+MAX_ATTEMPTS = 3  # Must match the coordinator when sharing the database
+HEARTBEAT_INTERVAL = 60  # Seconds between lease renewals and log reads
+POLL_INTERVAL = 30  # Seconds between lease requests while others finish
+MAX_SCF_ITERATIONS = 0  # Kill jobs whose SCF runs longer than this (0 to allow)
+MAX_STALLED_STEPS = 0  # Kill jobs whose energy stalls this many steps (0 to allow)
+KILL_UNCONVERGED_SCF = False  # Kill jobs that report an unconverged SCF
+SCRATCH_ROOT = ""  # Directory for private per-job scratch ("" to share)
+METRICS_FILE = "batch_metrics.jsonl"  # Stage timings of each job ("" to disable)
+PROMETHEUS_FILE = ""  # Prometheus text file of stage timings ("" to disable)
+
+RUNNER = GamessRunner(PATH_TO_GAMESS, TEMP_BINARY_DIR, SUPP_OUTPUT_DIR, VERSION,
+                      ConvergencePolicy(MAX_SCF_ITERATIONS, MAX_STALLED_STEPS,
+                                        KILL_UNCONVERGED_SCF),
+                      scratch_root=SCRATCH_ROOT)
+WORKER = "{}:{}".format(socket.gethostname(), os.getpid())
+
+
+def process_data(queue, job, number_of_processors, metrics=None):
+    # Runs a leased job, renewing its lease, and returns the result
+    input_directory, input_file = os.path.split(job)
+
+    def heartbeat():
+        try:
+            if not queue.heartbeat(WORKER, job):
+                return "lease lost to another worker"
+        except OSError:
+            pass  # The job keeps running until the lease expires
+        return None
+
+    timings = {}
+    with timed(timings, "stage"):
+        running_job = RUNNER.start_job(input_file, number_of_processors,
+                                       input_directory)
+    if running_job is None:
+        return queue.complete(WORKER, job, False, None, 0, number_of_processors)
+    running_job["timings"].update(timings)
+    timings = running_job["timings"]
+    with timed(timings, "execute"):
+        watch_job(running_job["process"], running_job["monitor"], input_file,
+                  HEARTBEAT_INTERVAL, heartbeat)
+    with timed(timings, "harvest"):
+        RUNNER.finish_job(running_job)
+
+    output_path = os.path.join(input_directory, running_job["output_name"])
+    with timed(timings, "parse"):
+        succeeded = (running_job["exit_status"] == 0 and
+                     exited_gracefully(output_path))
+    if metrics is not None:
+        metrics.record(running_job, RUNNER.name)
+    return queue.complete(WORKER, job, succeeded, running_job["exit_status"],
+                          running_job["wall_time"], number_of_processors,
+                          running_job["usage"])
+
+
+def main():
+    batch_time = start_batch_log("worker " + WORKER.replace(":", " ")
+                                 + " {}.log")
+
+    coordinator = sys.argv[1] if len(sys.argv) > 1 else COORDINATOR
+    logging.info("Worker {} taking jobs from {}.".format(WORKER, coordinator))
+    queue = connect_queue(coordinator, LEASE_SECONDS, MAX_ATTEMPTS)
+    metrics = None
+    if METRICS_FILE or PROMETHEUS_FILE:
+        metrics = BatchMetrics(METRICS_FILE, PROMETHEUS_FILE, batch_time)
+
+    try:
+        while True:
+            try:
+                job = queue.lease(WORKER)
+                if job is None:
+                    # Leased jobs of other workers may still be queued again
+                    counts = queue.counts()
+                    if not counts.get(QUEUED) and not counts.get(LEASED):
+                        break
+                    time.sleep(POLL_INTERVAL)
+                    continue
+
+                logging.info("Beginning gamess job for {}.".format(job))
+                if process_data(queue, job, NUMBER_OF_PROCESSORS, metrics):
+                    logging.info("gamess job for {} complete.".format(job))
+                else:
+                    logging.warning("Lease on {} was lost. Result discarded."
+                                    .format(job))
+            except OSError:
+                # A coordinator that has finished the batch no longer listens
+                logging.error("Coordinator {} not reachable."
+                              .format(coordinator))
+                break
+    finally:
+        queue.close()
+        if metrics is not None:
+            metrics.close()
+        RUNNER.close()
+    logging.info("Worker exiting.")
+
+
+if __name__ == "__main__":
+    main()
@@ -8,53 +8,113 @@ optimizations running through different levels of DFT basis sets.
 
 This script will run all gamess .inp files in the directory from which the
 script is run. It will not double-process data if a .log file for the data
-set is present.
+set is present. When CACHE_DIR is set, each basis set step is instead
+matched by its input contents against previously computed logs, which are
+restored without rerunning gamess.
+
+Every step is recorded in a job journal (JOURNAL_FILE), so an interrupted
+batch continues from the step where each molecule stopped.
+
+Setting CORE_BUDGET runs the basis set steps of different molecules at the
+same time, each step starting as soon as the same molecule's previous step
+has finished. Steps run under asyncio, so the next step is staged while the
+running ones finish. Waiting steps are started longest first, ranked by run
+times predicted from earlier batches in RESULTS_DATABASE or by electron count.
+
+BASIS_SET selects the ladder of basis sets from basisSets.py.
+
+When LADDER_ENERGY_THRESHOLD is set, the energy and geometry of each basis set
+are compared with the previous one. Once both change less than the thresholds,
+the remaining intermediate basis sets are skipped.
+
+When WARM_START is set, each basis set starts from the previous one's
+converged orbitals ($VEC, read with GUESS=MOREAD) and hessian ($HESS, read
+with HESS=READ) from the .dat file in SUPP_OUTPUT_DIR. gamess only reads
+orbitals over the same number of basis functions, so orbitals are carried
+only between basis sets that differ in NGAUSS alone; the hessian is carried
+whenever gamess wrote one. The first SCF iterations and geometry steps of
+each step are recorded in RESULTS_DATABASE, and at the end of the batch the
+warm started steps of each basis set are compared with cold started ones.
+
+The time each step spends in every stage of the batch, including parsing its
+log and generating the next input, is written to METRICS_FILE as JSON lines
+and, when PROMETHEUS_FILE is set, totalled in a Prometheus text file for
+node_exporter.
 
 To run this script:
 sudo python3 optimizeBatchRun.py
 In linux, always run this script as a superuser (su or sudo).
 """
 
-import datetime
 import logging
 import os
-import shutil
-import subprocess
+import re
+import sys
 import time
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             os.pardir, os.pardir, "common"))
+from asyncRunner import run_batch
+from basisSets import BASIS_SET_FAMILIES
+from batchLog import start_batch_log
+from batchMetrics import BatchMetrics, timed
+from gamessInput import basis_line, orbitals_compatible, set_warm_start
+from gamessJob import GamessRunner
+from gamessLog import (exited_gracefully, parse_log, read_dat_groups,
+                       vec_orbital_count)
+from gamessMonitor import ConvergencePolicy
+from jobJournal import DONE, FAILED, QUEUED, RUNNING, JobJournal
+from jobOrder import insert_longest_first, order_longest_first
+from molecule import Molecule
+from processorPolicy import ProcessorPolicy, read_input_features
+from resultCache import ResultCache
+from resultStore import ResultStore
+
 # Constants that should be edited based on your system
 PATH_TO_GAMESS = "/home/asher/Programs/gamess/"  # Full path to gamess folder
 TEMP_BINARY_DIR = "/scr/asher/"  # Directory for binary output files
 SUPP_OUTPUT_DIR = "/home/asher/scr/"  # Directory for supplemental output files
 VERSION = "01"  # Version number for gamess
+NUMBER_OF_PROCESSORS = 4  # Processors for each step when running one at a time
+CORE_BUDGET = 0  # Total processors for concurrent steps (0 runs one at a time)
+MIN_PROCESSORS_PER_JOB = 2  # Smallest processor count given to a concurrent step
+RESULTS_DATABASE = "results.db"  # SQLite file for job results ("" to disable)
+MONITOR_INTERVAL = 60  # Seconds between reads of a running job's log
+MAX_SCF_ITERATIONS = 0  # Kill jobs whose SCF runs longer than this (0 to allow)
+MAX_STALLED_STEPS = 0  # Kill jobs whose energy stalls this many steps (0 to allow)
+KILL_UNCONVERGED_SCF = False  # Kill jobs that report an unconverged SCF
+LADDER_ENERGY_THRESHOLD = 0  # Hartree change that ends the ladder (0 runs all)
+LADDER_RMSD_THRESHOLD = 0.01  # Angstrom geometry RMSD that ends the ladder
+LADDER_EXIT = "collapse"  # "collapse" runs the last basis set next, "skip" stops
+JOURNAL_FILE = "batch_journal.jsonl"  # Job state journal ("" to disable)
+CACHE_DIR = ""  # Directory for cached output logs ("" to disable)
+CACHE_MAX_BYTES = 10 * 1024 ** 3  # Size limit for the output log cache
+SCRATCH_ROOT = ""  # Directory for private per-job scratch ("" to share)
+ADAPTIVE_PROCESSORS = False  # Choose processors per job from RESULTS_DATABASE
+MAX_PROCESSORS_PER_JOB = 16  # Largest processor count chosen for a job
+MIN_PARALLEL_EFFICIENCY = 0.7  # Lowest parallel efficiency worth more cores
+METRICS_FILE = "batch_metrics.jsonl"  # Stage timings of each step ("" to disable)
+PROMETHEUS_FILE = ""  # Prometheus text file of stage timings ("" to disable)
+WARM_START = False  # Start each basis set from the previous orbitals and hessian
 
 # Logging constants
-DATETIME = datetime.datetime.now().strftime("%Y-%m-%d %H_%M_%S")
 LOGGING_LEVEL = logging.INFO
 
 # Basis Set constants
-# Processing order for basis sets.
-B3LYP_BASIS_SETS = ["4-31G",
-                    "5-31G",
-                    "6-31G",
-                    "6-311G",
-                    "6-311G(d)",
-                    "6-311G(d,p)",
-                    "6-311+G(d,p)",
-                    "6-311++G(d,p)"]  # TODO: Add test conditions for CCnWC -> ACCnWC and PCseg-n -> APCseg-n basis sets
-# Parameters for basis sets
-# "Basis set": (GBASIS, NGAUSS, NDFUNC, NPFUNC, DIFFSP, DIFFS)
-B3LYP_BASIS_DICT = {"4-31G": ("N31", "4", "", "", "", ""),
-                    "5-31G": ("N31", "5", "", "", "", ""),
-                    "6-31G": ("N31", "6", "", "", "", ""),
-                    "6-311G": ("N311", "5", "", "", "", ""),
-                    "6-311G(d)": ("N311", "6", "1", "", "", ""),
-                    "6-311G(d,p)": ("N311", "6", "1", "1", "", ""),
-                    "6-311+G(d,p)": ("N311", "6", "1", "1", ".TRUE.", ""),
-                    "6-311++G(d,p)": ("N311", "6", "1", "1", ".TRUE.", ".TRUE.")}
-
-
-def build_data_sets():
+BASIS_SET = "Pople"  # Basis set family from basisSets.py
+# Processing order and parameters of the basis sets
+B3LYP_BASIS_SETS = BASIS_SET_FAMILIES[BASIS_SET][0]
+
+# Names of the .dat groups carried between basis sets in the result store
+WARM_START_GROUPS = {"$VEC": "orbitals", "$HESS": "hessian"}
+
+RUNNER = GamessRunner(PATH_TO_GAMESS, TEMP_BINARY_DIR, SUPP_OUTPUT_DIR, VERSION,
+                      ConvergencePolicy(MAX_SCF_ITERATIONS, MAX_STALLED_STEPS,
+                                        KILL_UNCONVERGED_SCF),
+                      scratch_root=SCRATCH_ROOT)
+
+
+def build_data_sets(result_cache=None, journal=None):
     data_sets = []
     processed_data_sets = []
     input_dir_list = os.listdir(os.getcwd())
@@ -67,25 +127,48 @@ def build_data_sets():
             processed_data_sets.append(file)
     logging.debug("Input read complete.")
 
-    # Check to see if file was processed (check .inp against .log)
-    for data_set in data_sets:
-        if (data_set.split("Input.inp")[0] + "Output.log") in processed_data_sets:
-            data_sets.remove(data_set)
-            logging.info("{} already processed. Removing from queue."
-                         .format(data_set))
+    if journal is not None:
+        # Inputs generated for later basis sets are resumed through their
+        # molecule, so only the first input of each molecule is queued
+        data_sets = [data_set for data_set in data_sets
+                     if journal.jobs.get(data_set, {}).get("step", 0) == 0]
+
+    if result_cache is not None:
+        # Finished basis sets are restored from the cache, so only inputs
+        # generated for later basis sets are removed from the queue
+        data_sets = [data_set for data_set in data_sets
+                     if not re.search(r"\d-Input\.inp$", data_set)]
+    else:
+        # Check to see if file was processed. Molecules in the journal are
+        # checked by state; others are checked .inp against .log.
+        for data_set in data_sets[:]:
+            name = data_set.split("Input.inp")[0]
+            state = None if journal is None else journal.state(name)
+            if state in (DONE, FAILED) or (state is None and
+                                           (name + "Output.log")
+                                           in processed_data_sets):
+                data_sets.remove(data_set)
+                logging.info("{} already processed. Removing from queue."
+                             .format(data_set))
     data_sets.sort()
     logging.debug("Processed files removed from queue.")
     return data_sets
 
 
-def build_next_input(name, basis_set_index, next_basis_set):
-    gamess_output_name = name + "Output.log"
-    new_input_name = name + str(basis_set_index) + "-Input.inp"
+def build_next_input(name, new_input_name, next_basis_set, geometry,
+                     warm_start_groups=None):
+    # geometry is the Molecule read from the finished step's log, and
+    # warm_start_groups are the $VEC and $HESS groups from read_warm_start
     old_input_name = name + "Input.inp"
+    if warm_start_groups is None:
+        warm_start_groups = {}
 
     # Read required data from files
-    gamess_header = read_gamess_header(old_input_name)
-    atom_coords = read_atom_coords(gamess_output_name)
+    orbitals = 0
+    if "$VEC" in warm_start_groups:
+        orbitals = vec_orbital_count(warm_start_groups["$VEC"])
+    gamess_header = set_warm_start(read_gamess_header(old_input_name),
+                                   orbitals, "$HESS" in warm_start_groups)
 
     # Open new input file
     new_input_file = open(new_input_name, 'w')
@@ -94,27 +177,7 @@ def build_next_input(name, basis_set_index, next_basis_set):
     header_line_index = 0
     for header_line in gamess_header:
         if "$BASIS" in header_line:
-            new_line = " $BASIS GBASIS={} NGAUSS={} " \
-                .format(B3LYP_BASIS_DICT[next_basis_set][0],
-                        B3LYP_BASIS_DICT[next_basis_set][1])
-
-            # Add heavy atom polarization
-            if "d" in next_basis_set:
-                new_line += "NDFUNC={} ".format(B3LYP_BASIS_DICT[next_basis_set][2])
-
-            # Add hydrogen polarization
-            if "p" in next_basis_set:
-                new_line += "NPFUNC={} ".format(B3LYP_BASIS_DICT[next_basis_set][3])
-
-            # Add heavy atom diffuse functions
-            if "+" in next_basis_set:
-                new_line += "DIFFSP={} ".format(B3LYP_BASIS_DICT[next_basis_set][4])
-
-            # Add hydrogen diffuse functions
-            if "++" in next_basis_set:
-                new_line += "DIFFS={} ".format(B3LYP_BASIS_DICT[next_basis_set][5])
-
-            new_line += "$END\n"
+            new_line = basis_line(next_basis_set)
         elif "$CONTRL" in header_line:
             new_line = " $CONTRL SCFTYP=RHF RUNTYP=OPTIMIZE DFTTYP=B3LYP "
 
@@ -132,86 +195,210 @@ def build_next_input(name, basis_set_index, next_basis_set):
         new_input_file.write(new_line)
         header_line_index += 1
 
-    coord_line = 0
-    for coordinate in atom_coords:
-        if coord_line > 2:
-            new_input_file.write(coordinate[1:])
-        coord_line += 1
+    new_input_file.writelines(geometry.data_lines())
 
     new_input_file.write(" $END")
+
+    # Orbitals and hessian follow $DATA
+    for group in ["$VEC", "$HESS"]:
+        if group in warm_start_groups:
+            new_input_file.write("\n")
+            new_input_file.write("".join(warm_start_groups[group]).rstrip("\n"))
     new_input_file.close()
 
 
+def cache_output(result_cache, job):
+    # Only logs from successful runs are reused
+    if result_cache is None:
+        return
+    output_name = job["output_name"]
+    with timed(job["timings"], "parse"):
+        succeeded = job["exit_status"] == 0 and exited_gracefully(output_name)
+    if succeeded:
+        result_cache.store(result_cache.key(job["input_file"]), output_name)
+
+
+def complete_step(molecule, exit_status, run_time, result_store,
+                  journal=None, processors=None, timings=None, usage=None):
+    # Records a finished basis set step and builds the input for the next
+    # one. Returns the next input file, or None when the molecule is done.
+    # The time spent parsing and building the input is added to timings.
+    input_file = molecule["input_file"]
+    basis_set = B3LYP_BASIS_SETS[molecule["basis_set_index"]]
+
+    # Read termination status and results from the log in one pass
+    name = input_file.split("Input.inp")[0]
+    output_name = name + "Output.log"
+    with timed(timings, "parse"):
+        log_summary = parse_log(output_name)
+        log_summary["molecule"] = None
+        if log_summary["geometry"] is not None:
+            try:
+                log_summary["molecule"] = Molecule.from_geometry_lines(
+                    log_summary["geometry"])
+            except ValueError as error:
+                logging.warning("Could not read the equilibrium geometry in "
+                                "{}: {}".format(output_name, error))
+    logging.info("Final energy: {} after {} SCF iterations."
+                 .format(log_summary["final_energy"],
+                         log_summary["scf_iterations"]))
+    logging.info("First SCF took {} iterations. Geometry steps: {}."
+                 .format(log_summary["first_scf_iterations"],
+                         log_summary["geometry_steps"]))
+
+    if result_store is not None:
+        atoms, gamess_basis = read_input_features(input_file)
+        result_store.add("gamess", "{} {}".format(input_file.split(".inp")[0],
+                                                  basis_set),
+                         os.path.abspath(input_file), run_time, exit_status,
+                         energy=log_summary["final_energy"],
+                         output_path=os.path.abspath(output_name),
+                         processors=processors, atoms=atoms,
+                         basis_set=gamess_basis, usage=usage,
+                         first_scf_iterations=log_summary[
+                             "first_scf_iterations"],
+                         geometry_steps=log_summary["geometry_steps"],
+                         warm_start=molecule["warm_start"])
+
+    # Determine next basis set
+    basis_set_index = molecule["basis_set_index"] + 1
+    if basis_set_index == len(B3LYP_BASIS_SETS):
+        logging.info("All basis sets complete.")
+        record_molecule(journal, molecule, DONE)
+        return None
+
+    # Check to see if gamess "exited gracefully"
+    if not log_summary["exited_gracefully"]:
+        logging.warning("gamess did not exit gracefully.")
+        logging.warning("Check the gamess output file for details.")
+        logging.warning("Continuing to next input file.")
+        record_molecule(journal, molecule, FAILED)
+        return None
+
+    # An optimization that ran out of steps exits gracefully without an
+    # equilibrium geometry to carry to the next basis set
+    if log_summary["molecule"] is None:
+        logging.warning("No equilibrium geometry found in {}."
+                        .format(output_name))
+        logging.warning("Continuing to next input file.")
+        record_molecule(journal, molecule, FAILED)
+        return None
+
+    # Skip the remaining basis sets once the results stop changing
+    if ladder_converged(molecule["previous_summary"], log_summary):
+        if LADDER_EXIT == "collapse":
+            skipped = B3LYP_BASIS_SETS[basis_set_index:-1]
+        else:
+            skipped = B3LYP_BASIS_SETS[basis_set_index:]
+        if skipped:
+            logging.info("Basis sets converged. Skipping {}."
+                         .format(", ".join(skipped)))
+            logging.info("Saved at least {} hours."
+                         .format(len(skipped) * run_time / (60 * 60)))
+            basis_set_index += len(skipped)
+            if basis_set_index == len(B3LYP_BASIS_SETS):
+                record_molecule(journal, molecule, DONE)
+                return None
+    next_basis_set = B3LYP_BASIS_SETS[basis_set_index]
+
+    # Name inputs after the molecule and step, not the previous input, so
+    # concurrent molecules never share a file name
+    new_input_name = molecule["name"] + str(basis_set_index) + "-Input.inp"
+
+    # Build next GAMESS input file
+    logging.info("Generating input for {} basis set.".format(next_basis_set))
+    with timed(timings, "input_generation"):
+        warm_start_groups = {}
+        if WARM_START:
+            warm_start_groups = read_warm_start(name, basis_set,
+                                                next_basis_set)
+        build_next_input(name, new_input_name, next_basis_set,
+                         log_summary["molecule"], warm_start_groups)
+    logging.info("Input generation complete.")
+
+    molecule["input_file"] = new_input_name
+    molecule["basis_set_index"] = basis_set_index
+    molecule["previous_summary"] = log_summary
+    molecule["warm_start"] = ",".join(WARM_START_GROUPS[group] for group
+                                      in warm_start_groups)
+    if journal is not None:
+        journal.record(new_input_name, QUEUED, molecule=molecule["name"],
+                       step=basis_set_index, warm_start=molecule["warm_start"])
+    return new_input_name
+
+
+def ladder_converged(previous_summary, log_summary):
+    # True when the energy and geometry changed less than the ladder
+    # thresholds between two consecutive basis sets
+    if not LADDER_ENERGY_THRESHOLD or previous_summary is None:
+        return False
+    if previous_summary["final_energy"] is None or \
+            log_summary["final_energy"] is None or \
+            previous_summary["molecule"] is None or \
+            log_summary["molecule"] is None:
+        return False
+
+    energy_change = abs(log_summary["final_energy"] -
+                        previous_summary["final_energy"])
+    rmsd = previous_summary["molecule"].rmsd(log_summary["molecule"])
+    logging.info("Change from previous basis set: energy {} Hartree, "
+                 "RMSD {} Angstroms.".format(energy_change, rmsd))
+    return (rmsd is not None and energy_change <= LADDER_ENERGY_THRESHOLD and
+            rmsd <= LADDER_RMSD_THRESHOLD)
+
+
 def main():
     batch_start_time = time.time()
-    # Set up log file for batch process.
-    # NOTE: this is different than the gamess .log files.
-    log_filename = DATETIME + ".log"
+    batch_time = start_batch_log(level=LOGGING_LEVEL)
 
-    file_out = logging.FileHandler(log_filename)
-    console_out = logging.StreamHandler()
-    handlers = [file_out, console_out]
-    logging.basicConfig(level=LOGGING_LEVEL,
-                        format='%(asctime)s: %(levelname)s: %(message)s',
-                        handlers=handlers)
+    result_cache = None
+    if CACHE_DIR:
+        result_cache = ResultCache(CACHE_DIR, VERSION, CACHE_MAX_BYTES)
 
-    logging.info("Beginning log for batch started {}."
-                 .format(DATETIME.replace("_", ":")))
+    journal = None
+    if JOURNAL_FILE:
+        journal = JobJournal(JOURNAL_FILE)
+        RUNNER.journal = journal
 
     # Read all files in working directory
-    data_sets = build_data_sets()
+    data_sets = build_data_sets(result_cache, journal)
+
+    # Past run times predict the cost of each step
+    cost_model = None
+    result_store = None
+    if RESULTS_DATABASE:
+        cost_model = ProcessorPolicy(
+            RESULTS_DATABASE, NUMBER_OF_PROCESSORS, MIN_PROCESSORS_PER_JOB,
+            MAX_PROCESSORS_PER_JOB, MIN_PARALLEL_EFFICIENCY)
+        if ADAPTIVE_PROCESSORS:
+            RUNNER.processor_policy = cost_model
+        result_store = ResultStore(RESULTS_DATABASE, batch_time)
+
+    metrics = None
+    if METRICS_FILE or PROMETHEUS_FILE:
+        metrics = BatchMetrics(METRICS_FILE, PROMETHEUS_FILE, batch_time)
+
+    # Start the largest molecules first so the batch does not end on one
+    # long basis set ladder
+    data_sets = order_longest_first(data_sets, cost_model)
 
     # Run each unprocessed input file
-    for input_file in data_sets:
-        # Generates gamess inputs for each of the given basis sets
-        # Subsequently runs the gamess calculations for the inputs
-        basis_set_index = 0
-        for basis_set in B3LYP_BASIS_SETS:
-            logging.info("Beginning gamess job for {} with {} basis set."
-                         .format(input_file, basis_set))
-
-            start_time = time.time()
-            process_data(input_file, 4)
-            end_time = time.time()
-
-            logging.info("gamess job for {} complete.".format(input_file))
-            logging.info("Run time: {} hours.".
-                         format((end_time - start_time) / (60 * 60)))
-
-            # Create new gamess inputs for next basis set
-            try:
-                # Determine next basis set
-                basis_set_index += 1
-                next_basis_set = B3LYP_BASIS_SETS[basis_set_index]
-            except IndexError:
-                logging.info("All basis sets complete.")
-                # Process next data set
-                continue
-
-            # Determine file names
-            name = input_file.split("Input.inp")[0]
-            new_input_name = name + str(basis_set_index) + "-Input.inp"
-            gamess_output_name = name + "Output.log"
-
-            # Check to see if gamess "exited gracefully"
-            exited_gracefully = False
-            gamess_output_file = open(gamess_output_name, 'r')
-            for output_line in gamess_output_file:
-                if "exited gracefully" in output_line:
-                    exited_gracefully = True
-            gamess_output_file.close()
-            if not exited_gracefully:
-                logging.warning("gamess did not exit gracefully.")
-                logging.warning("Check the gamess output file for details.")
-                logging.warning("Continuing to next input file.")
-                break
-
-            # Build next GAMESS input file
-            logging.info("Generating input for {} basis set.".format(next_basis_set))
-            build_next_input(name, basis_set_index, next_basis_set)
-            logging.info("Input generation complete.")
-
-            input_file = new_input_name
+    if CORE_BUDGET:
+        logging.info("Running basis set steps concurrently on {} processors."
+                     .format(CORE_BUDGET))
+    try:
+        run_pipelined(data_sets, CORE_BUDGET, result_store, result_cache,
+                      journal, cost_model, metrics)
+        if result_store is not None and WARM_START:
+            report_warm_start(result_store)
+    finally:
+        if result_store is not None:
+            result_store.close()
+        if journal is not None:
+            journal.close()
+        if metrics is not None:
+            metrics.close()
+        RUNNER.close()
 
     batch_end_time = time.time()
     logging.info("Batch process complete.")
@@ -219,59 +406,35 @@ def main():
                  .format((batch_end_time - batch_start_time) / (60 * 60)))
 
 
-def process_data(input_file, number_of_processors=4):
-    name = input_file.split("Input.inp")[0]
-    output_name = name + "Output.log"
-
-    input_directory = os.getcwd()
-
-    # Copy input file to gamess directory
-    try:
-        logging.debug("Copying input data file to gamess directory.")
-        shutil.copyfile(os.path.join(input_directory, input_file),
-                        os.path.join(PATH_TO_GAMESS, input_file))
-    except FileNotFoundError:
-        logging.error("{} not found in gamess directory. Moving to next file.")
-        return
-
-    os.chdir(PATH_TO_GAMESS)
-
-    remove_residuals(name)
-
-    # Run gamess job
-    logging.info("Beginning gamess process.")
-    output_log = open(output_name, 'w')
-    subprocess.call(["./rungms", input_file, VERSION,
-                     str(number_of_processors)], stdout=output_log)
-    output_log.close()
-    logging.info("gamess process complete.")
-
-    # Clean up files from run and copy output to input directory
-    try:
-        os.remove(os.path.join(PATH_TO_GAMESS, input_file))
-        shutil.copyfile(os.path.join(PATH_TO_GAMESS, output_name),
-                        os.path.join(input_directory, output_name))
-        logging.info("Output file copied to starting directory.")
-        os.remove(os.path.join(PATH_TO_GAMESS, output_name))
-    except FileNotFoundError:
-        logging.warning("Output file not found.")
-    finally:
-        os.chdir(input_directory)  # Return to input directory for next job
-
-
-def read_atom_coords(gamess_output_name):
-    gamess_output = open(gamess_output_name, 'r')
-    atom_coords = []
-    for output_line in gamess_output:
-        if "EQUILIBRIUM GEOMETRY LOCATED" in output_line:
-            while True:
-                for selected_line in gamess_output:
-                    if selected_line is not "\n":
-                        atom_coords.append(selected_line)
-                    else:
-                        logging.debug("Extracted atom coordinates from gamess output file.")
-                        gamess_output.close()
-                        return atom_coords
+def new_molecule(input_file):
+    # Progress of one input file through the basis set ladder
+    return {"name": input_file.split("Input.inp")[0],
+            "input_file": input_file,
+            "basis_set_index": 0,
+            "previous_summary": None,
+            "warm_start": ""}
+
+
+def read_warm_start(name, basis_set, next_basis_set):
+    # Returns the groups of the .dat file of a finished step that the next
+    # basis set can read: the hessian, and the orbitals when both basis sets
+    # have the same number of basis functions
+    gamess_dat_name = os.path.join(SUPP_OUTPUT_DIR, name + "Input.dat")
+    groups = read_dat_groups(gamess_dat_name)
+    if "$VEC" in groups and not orbitals_compatible(basis_set,
+                                                    next_basis_set):
+        logging.info("Orbitals of {} basis set do not fit {}. Starting SCF "
+                     "from the default guess.".format(basis_set,
+                                                      next_basis_set))
+        del groups["$VEC"]
+    if groups:
+        logging.info("Warm start from the {} of {}.".format(
+            " and ".join(WARM_START_GROUPS[group] for group in groups),
+            gamess_dat_name))
+    else:
+        logging.info("No orbitals or hessian found in {}."
+                     .format(gamess_dat_name))
+    return groups
 
 
 def read_gamess_header(old_input_name):
@@ -287,21 +450,100 @@ def read_gamess_header(old_input_name):
     return header
 
 
-def remove_residuals(name):
-    # Check for and remove all residual files from previous gamess runs
-    supp_out_files = os.listdir(SUPP_OUTPUT_DIR)
-    for file in supp_out_files:
-        if file.startswith(name):
-            os.remove(os.path.join(SUPP_OUTPUT_DIR, file))
-            logging.warning("Removed {} from supplemental output directory."
-                            .format(file))
-
-    temp_binary_files = os.listdir(TEMP_BINARY_DIR)
-    for file in temp_binary_files:
-        if file.startswith(name):
-            os.remove(os.path.join(TEMP_BINARY_DIR, file))
-            logging.warning("Removed {} from temporary binary directory."
-                            .format(file))
+def record_molecule(journal, molecule, state):
+    # Molecules are journaled under their name, separately from their steps
+    if journal is not None:
+        journal.record(molecule["name"], state)
+
+
+def report_warm_start(result_store):
+    # Logs how much warm started steps of each basis set saved over cold
+    # started ones, from this and earlier batches
+    def saving(cold, warm):
+        return None if cold is None or warm is None else round(cold - warm, 1)
+
+    steps = {}
+    for row in result_store.warm_start_savings():
+        steps.setdefault(row[0], {})[row[1]] = row[2:]
+    for basis_set, summaries in steps.items():
+        if 0 not in summaries or 1 not in summaries:
+            continue
+        cold, warm = summaries[0], summaries[1]
+        logging.info("Warm start of {} ({} warm, {} cold steps) saved {} "
+                     "first SCF iterations, {} geometry steps and {} seconds "
+                     "per step.".format(basis_set, warm[0], cold[0],
+                                        *[saving(cold_mean, warm_mean)
+                                          for cold_mean, warm_mean
+                                          in zip(cold[1:], warm[1:])]))
+
+
+def run_pipelined(data_sets, core_budget, result_store, result_cache,
+                  journal=None, cost_model=None, metrics=None):
+    # Each basis set step of a molecule depends only on the molecule's
+    # previous step. A step is queued as soon as its previous step finishes,
+    # so steps of different molecules run side by side within core_budget
+    # (or one at a time when it is 0), with the next step staged while the
+    # running ones finish. The queue is kept longest step first.
+    queue = []
+    sort_keys = {}
+    molecules = {}
+
+    def queue_step(molecule, input_file):
+        # Steps found in the result cache are completed without running
+        while input_file is not None:
+            output_name = input_file.split("Input.inp")[0] + "Output.log"
+            if result_cache is None or not result_cache.restore(
+                    result_cache.key(input_file), output_name):
+                molecules[input_file] = molecule
+                insert_longest_first(queue, input_file, sort_keys, cost_model)
+                return
+            logging.info("{} found in result cache. Restored {}."
+                         .format(input_file, output_name))
+            input_file = complete_step(molecule, 0, 0, result_store, journal)
+
+    def on_complete(job):
+        molecule = molecules.pop(job["input_file"])
+        sort_keys.pop(job["input_file"], None)
+        cache_output(result_cache, job)
+        next_input = complete_step(molecule, job["exit_status"],
+                                   job["wall_time"], result_store, journal,
+                                   job["number_of_processors"], job["timings"],
+                                   job["usage"])
+        queue_step(molecule, next_input)
 
-
-main()
+    for input_file in data_sets:
+        molecule, input_file = start_molecule(input_file, journal)
+        queue_step(molecule, input_file)
+
+    run_batch(RUNNER, queue, core_budget, MIN_PROCESSORS_PER_JOB,
+              MONITOR_INTERVAL, on_complete, NUMBER_OF_PROCESSORS, metrics)
+
+
+def start_molecule(input_file, journal):
+    # Returns the molecule and the input of the step to run next. A molecule
+    # that was interrupted continues from its last journaled step.
+    molecule = new_molecule(input_file)
+    if journal is None:
+        return molecule, input_file
+
+    steps = [record for record in journal.jobs.values()
+             if record.get("molecule") == molecule["name"]]
+    if not steps:
+        record_molecule(journal, molecule, RUNNING)
+        journal.record(input_file, QUEUED, molecule=molecule["name"], step=0)
+        return molecule, input_file
+
+    latest = max(steps, key=lambda record: record["step"])
+    molecule["input_file"] = latest["job"]
+    molecule["basis_set_index"] = latest["step"]
+    molecule["warm_start"] = latest.get("warm_start", "")
+    logging.info("Resuming {} at {} basis set."
+                 .format(input_file, B3LYP_BASIS_SETS[latest["step"]]))
+    if latest["state"] == DONE:
+        # The step finished before its next input was built
+        return molecule, complete_step(molecule, 0, 0, None, journal)
+    return molecule, latest["job"]
+
+
+if __name__ == "__main__":
+    main()
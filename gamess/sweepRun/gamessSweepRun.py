@@ -0,0 +1,185 @@
+#!/usr/bin/python3
+"""
+This script is designed to run a sweep of gamess jobs built from one template
+input. Every combination of the values of the sweep axes is run: basis sets
+from basisSets.py (SWEEP_BASIS_SETS), DFT functionals (SWEEP_FUNCTIONALS),
+SCF types (SWEEP_SCF_TYPES) and the geometries of a multi-frame .xyz file
+(SWEEP_GEOMETRIES). An empty axis keeps the template's setting.
+
+Inputs are written one at a time as the batch reaches them, so even a very
+large sweep starts running at once. Each point is named after the template
+and its position in the sweep (waterSweep-00042Input.inp for the template
+waterInput.inp), so the sweep axes must not be changed between runs of one
+sweep. Points with a .log file or recorded as done in the job journal
+(JOURNAL_FILE) are skipped, so an interrupted sweep continues where it
+stopped.
+
+Setting CORE_BUDGET runs several points at once, splitting the given number
+of processors between them. The time each job spends in every stage of the
+batch, including generating its input, is written to METRICS_FILE.
+
+To run this script:
+sudo python3 gamessSweepRun.py
+In linux, always run this script as a superuser (su or sudo).
+"""
+
+import logging
+import os
+import sys
+import time
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             os.pardir, os.pardir, "common"))
+from asyncRunner import run_batch
+from batchLog import start_batch_log
+from batchMetrics import BatchMetrics, timed
+from gamessInput import (basis_parameters, build_sweep_input, read_template,
+                         sweep_points)
+from gamessJob import GamessRunner
+from gamessLog import read_final_energy
+from gamessMonitor import ConvergencePolicy
+from jobJournal import DONE, QUEUED, JobJournal
+from processorPolicy import read_input_features
+from resultStore import ResultStore
+
+# Constants that should be edited based on your system
+PATH_TO_GAMESS = "/home/asher/Programs/gamess/"  # Full path to gamess folder
+TEMP_BINARY_DIR = "/scr/asher/"  # Directory for binary output files
+SUPP_OUTPUT_DIR = "/home/asher/scr/"  # Directory for supplemental output files
+VERSION = "01"  # Version number for gamess
+NUMBER_OF_PROCESSORS = 4  # Processors for each job when running one at a time
+CORE_BUDGET = 0  # Total processors for concurrent jobs (0 runs one at a time)
+MIN_PROCESSORS_PER_JOB = 2  # Smallest processor count given to a concurrent job
+RESULTS_DATABASE = "results.db"  # SQLite file for job results ("" to disable)
+MONITOR_INTERVAL = 60  # Seconds between reads of a running job's log
+MAX_SCF_ITERATIONS = 0  # Kill jobs whose SCF runs longer than this (0 to allow)
+MAX_STALLED_STEPS = 0  # Kill jobs whose energy stalls this many steps (0 to allow)
+KILL_UNCONVERGED_SCF = False  # Kill jobs that report an unconverged SCF
+JOURNAL_FILE = "batch_journal.jsonl"  # Job state journal ("" to disable)
+SCRATCH_ROOT = ""  # Directory for private per-job scratch ("" to share)
+METRICS_FILE = "batch_metrics.jsonl"  # Stage timings of each job ("" to disable)
+PROMETHEUS_FILE = ""  # Prometheus text file of stage timings ("" to disable)
+
+# Sweep constants
+TEMPLATE_INPUT = "templateInput.inp"  # Input whose settings are swept
+SWEEP_BASIS_SETS = ["6-31G", "6-311G(d,p)"]  # Names from basisSets.py
+SWEEP_FUNCTIONALS = ["B3LYP"]  # DFTTYP values
+SWEEP_SCF_TYPES = ["RHF"]  # SCFTYP values
+SWEEP_GEOMETRIES = ""  # Multi-frame .xyz file of geometries ("" for the template's)
+
+RUNNER = GamessRunner(PATH_TO_GAMESS, TEMP_BINARY_DIR, SUPP_OUTPUT_DIR, VERSION,
+                      ConvergencePolicy(MAX_SCF_ITERATIONS, MAX_STALLED_STEPS,
+                                        KILL_UNCONVERGED_SCF),
+                      scratch_root=SCRATCH_ROOT)
+
+
+def generate_inputs(journal=None):
+    # Writes the input of each sweep point when the batch reaches it and
+    # yields its name
+    header, template_atoms = read_template(TEMPLATE_INPUT)
+    title = header[-2].strip()
+    name = (os.path.basename(TEMPLATE_INPUT).split(".inp")[0]
+            .split("Input")[0] + "Sweep")
+    contrl_axes = {"DFTTYP": SWEEP_FUNCTIONALS, "SCFTYP": SWEEP_SCF_TYPES}
+
+    for point, (basis_set, contrl_options, frame, atoms) in enumerate(
+            sweep_points(SWEEP_BASIS_SETS, contrl_axes, SWEEP_GEOMETRIES)):
+        input_file = "{}-{:05d}Input.inp".format(name, point)
+        output_name = input_file.split("Input.inp")[0] + "Output.log"
+
+        # Check to see if the point was processed
+        state = None if journal is None else journal.state(input_file)
+        if state == DONE or (state is None and os.path.exists(output_name)):
+            logging.info("{} already processed. Skipping.".format(input_file))
+            continue
+
+        description = [value for value in
+                       [basis_set] + list(contrl_options.values())
+                       if value is not None]
+        if frame is not None:
+            description.append("frame {}".format(frame))
+        with open(input_file, 'w') as sweep_input:
+            sweep_input.writelines(build_sweep_input(
+                header, template_atoms, basis_set, contrl_options, atoms,
+                " ".join([title] + description)))
+        logging.info("Generated {} ({}).".format(input_file,
+                                                 ", ".join(description)))
+        if journal is not None:
+            journal.record(input_file, QUEUED, point=description)
+        yield input_file
+
+
+def record_result(result_store, job):
+    if result_store is None or job is None:
+        return
+    input_path = os.path.join(job["input_directory"], job["input_file"])
+    output_path = os.path.join(job["input_directory"], job["output_name"])
+    atoms, basis_set = read_input_features(input_path)
+    with timed(job["timings"], "parse"):
+        energy = read_final_energy(output_path)
+    result_store.add("gamess", job["input_file"].split(".inp")[0], input_path,
+                     job["wall_time"], job["exit_status"], energy=energy,
+                     output_path=output_path,
+                     processors=job["number_of_processors"], atoms=atoms,
+                     basis_set=basis_set, usage=job["usage"])
+
+
+def main():
+    batch_start_time = time.time()
+    batch_time = start_batch_log()
+
+    # Unknown basis sets would otherwise only fail when reached
+    try:
+        for basis_set in SWEEP_BASIS_SETS:
+            basis_parameters(basis_set)
+    except KeyError as error:
+        logging.error(error.args[0])
+        return
+    logging.info("Sweeping {} over {} basis sets, {} functionals and {} SCF "
+                 "types{}.".format(TEMPLATE_INPUT, len(SWEEP_BASIS_SETS),
+                                   len(SWEEP_FUNCTIONALS),
+                                   len(SWEEP_SCF_TYPES),
+                                   " for each geometry in " + SWEEP_GEOMETRIES
+                                   if SWEEP_GEOMETRIES else ""))
+
+    journal = None
+    if JOURNAL_FILE:
+        journal = JobJournal(JOURNAL_FILE)
+        RUNNER.journal = journal
+
+    result_store = None
+    if RESULTS_DATABASE:
+        result_store = ResultStore(RESULTS_DATABASE, batch_time)
+
+    metrics = None
+    if METRICS_FILE or PROMETHEUS_FILE:
+        metrics = BatchMetrics(METRICS_FILE, PROMETHEUS_FILE, batch_time)
+
+    # Run each sweep point as its input is generated
+    if CORE_BUDGET:
+        logging.info("Running jobs concurrently on {} processors."
+                     .format(CORE_BUDGET))
+
+    def on_complete(job):
+        record_result(result_store, job)
+
+    try:
+        run_batch(RUNNER, generate_inputs(journal), CORE_BUDGET,
+                  MIN_PROCESSORS_PER_JOB, MONITOR_INTERVAL, on_complete,
+                  NUMBER_OF_PROCESSORS, metrics)
+    finally:
+        if result_store is not None:
+            result_store.close()
+        if journal is not None:
+            journal.close()
+        if metrics is not None:
+            metrics.close()
+        RUNNER.close()
+
+    logging.info("Batch process complete.")
+    logging.info("Total batch processing time: {} hours"
+                 .format((time.time() - batch_start_time) / (60 * 60)))
+
+
+if __name__ == "__main__":
+    main()
@@ -4,105 +4,326 @@ Written by Stephen E. White
 Last updated : 09NOV2017
 
 This script is designed to run the given Smina input files as a batch.
+Setting WORKERS above 1 docks several compounds at once, each worker pinned to
+its own share of the available cores. Workers are run by asyncio, which
+starts the next compound as soon as a worker's process exits. Setting
+SDF_LIBRARY docks a single multi-molecule .sdf in chunks of CHUNK_SIZE
+molecules and writes the best score of each molecule to
+OUTPUT_DIR/<library>_scores.tsv. Each compound is recorded in a job journal
+(JOURNAL_FILE) so an interrupted batch redocks only the compounds that were
+not finished. Chunks are named after the library indices of their first and
+last molecules (<library>_chunk_<first>-<last>), and molecules inside docked
+chunks are skipped one by one, so CHUNK_SIZE may be changed between runs of
+one library.
+
+The time each job spends in every stage of the batch is written to
+METRICS_FILE as JSON lines and, when PROMETHEUS_FILE is set, totalled in a
+Prometheus text file for node_exporter.
 
 To run this script:
 python3 sminaBatchRun.py
 """
 
-import datetime
+import bisect
+import fnmatch
+import itertools
 import logging
+import mmap
 import os
-import subprocess
-import time
+import shutil
+import sys
+import tempfile
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             os.pardir, "common"))
+from asyncRunner import available_cores, run_batch
+from batchLog import start_batch_log
+from batchMetrics import BatchMetrics, timed
+from jobJournal import DONE, FAILED, QUEUED, RUNNING, JobJournal
+from resultStore import ResultStore, file_hash
+from sminaJob import SminaRunner, compound_name
 
 # Constants that should be edited based on your system
-DATETIME = datetime.datetime.now().strftime("%Y-%m-%d %H_%M_%S")
 SMINA_EXECUTABLE = "smina.static"
 TEST = False  # Set to True if you are testing SMINA configurations or debugging
+LIGAND_DIR = "."  # Directory searched for test compounds
+LIGAND_PATTERN = "compound_*.sdf"  # Glob pattern for test compound files
+RECURSIVE = False  # Set to True to also search subdirectories of LIGAND_DIR
+SDF_LIBRARY = ""  # Multi-molecule .sdf to dock in chunks instead of LIGAND_DIR
+CHUNK_SIZE = 100  # Number of molecules docked by each Smina job from SDF_LIBRARY
+OUTPUT_DIR = "output"  # Directory for docked poses and Smina logs
+RESULTS_DATABASE = "results.db"  # SQLite file for job results ("" to disable)
+JOURNAL_FILE = "batch_journal.jsonl"  # Job state journal ("" to disable)
+WORKERS = 1  # Number of Smina processes to run at once
+METRICS_FILE = "batch_metrics.jsonl"  # Stage timings of each job ("" to disable)
+PROMETHEUS_FILE = ""  # Prometheus text file of stage timings ("" to disable)
 
 
-def process_data(test_compound, protein_ligand, ligand):
-    name = test_compound.split(".sdf")[0]
-    output_name = os.path.join("output", name + "_output.sdf")
-    output_log_name = os.path.join("output", name + ".log")
-
-    flex_distance = 3.5
-    seed = 0
-    exhaustiveness = 32
-    scoring = "vinardo"
-
-    # Run Smina job
-    logging.info("Beginning Smina process.")
-    output_log = open(output_log_name, 'w')
-
-    if not TEST:
-        subprocess.call(["./{} --receptor {} --ligand {} --flexdist {} "
-                         "--flexdist_ligand {} --autobox_ligand {} "
-                         "--scoring {} --out {} --seed {} --exhaustiveness {}"
-                        .format(SMINA_EXECUTABLE, protein_ligand, test_compound,
-                                flex_distance, ligand, ligand, scoring,
-                                output_name, seed, exhaustiveness)],
-                        shell=True, stdout=output_log)
-    else:
-        subprocess.call(["./{} --receptor {} --ligand {} --flexdist {} "
-                         "--flexdist_ligand {} --autobox_ligand {} "
-                         "--scoring {} --out {} --seed {} --exhaustiveness {}"
-                        .format(SMINA_EXECUTABLE, protein_ligand, test_compound,
-                                flex_distance, ligand, ligand, scoring,
-                                output_name, seed, exhaustiveness)],
-                        shell=True, stdout=output_log)
+def find_ligands(directory, pattern, recursive=False, skip_names=()):
+    # Yields matching ligand paths one at a time so the library is never
+    # held in memory. Directories are walked depth first with os.scandir.
+    pending = [directory]
+    while pending:
+        current = pending.pop()
+        with os.scandir(current) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    if recursive and entry.path != os.path.join(directory, OUTPUT_DIR):
+                        pending.append(entry.path)
+                elif fnmatch.fnmatch(entry.name, pattern):
+                    if compound_name(entry.name) in skip_names:
+                        logging.info("{} already docked. Skipping."
+                                     .format(entry.path))
+                        continue
+                    yield os.path.relpath(entry.path)
 
-    output_log.close()
-    logging.info("Smina process complete.")
 
+def find_docked_names(output_dir):
+    # Names of compounds that already have Smina output
+    suffix = "_output.sdf"
+    with os.scandir(output_dir) as entries:
+        return {entry.name[:-len(suffix)] for entry in entries
+                if entry.name.endswith(suffix)}
 
-def main():
-    # Set up log file for batch process.
-    log_filename = DATETIME + ".log"
 
-    file_out = logging.FileHandler(log_filename)
-    console_out = logging.StreamHandler()
-    handlers = [file_out, console_out]
-    logging.basicConfig(level=logging.INFO,
-                        format='%(asctime)s: %(levelname)s: %(message)s',
-                        handlers=handlers)
+def record_docked(journal, test_compound, exit_status, wall_time):
+    if journal is not None:
+        journal.record(compound_name(test_compound),
+                       DONE if exit_status == 0 else FAILED,
+                       exit_status=exit_status, wall_time=wall_time)
+
+
+def journaled(test_compounds, journal):
+    # Records each compound as running when it is handed to Smina
+    for test_compound in test_compounds:
+        journal.record(compound_name(test_compound), RUNNING)
+        yield test_compound
+
+
+def read_sdf_records(sdf_library):
+    # Yields (index, name, record) for each $$$$-delimited molecule in the
+    # library. The file is memory-mapped so only one record is copied at once.
+    with open(sdf_library, 'rb') as library_file:
+        if os.fstat(library_file.fileno()).st_size == 0:
+            return
+        with mmap.mmap(library_file.fileno(), 0,
+                       access=mmap.ACCESS_READ) as library:
+            index = 0
+            start = 0
+            while start < len(library):
+                end = library.find(b"$$$$", start)
+                if end == -1:
+                    if library[start:].strip():
+                        logging.warning("Ignoring unterminated record at end "
+                                        "of {}.".format(sdf_library))
+                    return
+                end = library.find(b"\n", end)
+                end = len(library) if end == -1 else end + 1
+                record = library[start:end]
+                start = end
+                if not record.strip(b"$\r\n"):
+                    continue
+                name = record.split(b"\n", 1)[0].strip().decode(errors="replace")
+                yield index, name, record
+                index += 1
+
+
+def chunk_range(name, library_name):
+    # (first, last) library index of a chunk named by chunk_sdf_library, or
+    # None if name is not a chunk of the library
+    prefix = library_name + "_chunk_"
+    if not name.startswith(prefix):
+        return None
+    try:
+        first, last = name[len(prefix):].split("-")
+        return int(first), int(last)
+    except ValueError:
+        return None
+
+
+def chunk_sdf_library(sdf_library, chunk_size, chunk_dir, chunk_map,
+                      skip_names=()):
+    # Packs library records into chunk files of chunk_size molecules and
+    # yields each path as it is written. Each record's title is replaced by
+    # its library index; chunk_map keeps the index-to-name mapping until the
+    # chunk has been scored. Records inside the index range of a chunk in
+    # skip_names are left out, whatever chunk size that chunk was made with.
+    library_name = compound_name(sdf_library)
+    docked_ranges = sorted(chunk_range(name, library_name)
+                           for name in skip_names
+                           if chunk_range(name, library_name) is not None)
+    if docked_ranges:
+        logging.info("{} chunks of {} already docked. Skipping their "
+                     "molecules.".format(len(docked_ranges), sdf_library))
+    docked_firsts = [first for first, last in docked_ranges]
+
+    def docked(index):
+        position = bisect.bisect_right(docked_firsts, index) - 1
+        return position >= 0 and index <= docked_ranges[position][1]
+
+    records = (record for record in read_sdf_records(sdf_library)
+               if not docked(record[0]))
+    while True:
+        chunk = list(itertools.islice(records, chunk_size))
+        if not chunk:
+            return
+        # Every molecule in the index range is in this chunk or was docked
+        chunk_path = os.path.join(chunk_dir, "{}_chunk_{}-{}.sdf".format(
+            library_name, chunk[0][0], chunk[-1][0]))
+
+        with open(chunk_path, 'wb') as chunk_file:
+            for index, name, record in chunk:
+                chunk_file.write(str(index).encode() + b"\n")
+                chunk_file.write(record.split(b"\n", 1)[1])
+        chunk_map[chunk_path] = [(index, name) for index, name, record in chunk]
+        yield chunk_path
+
+
+def read_docking_scores(output_name):
+    # Returns the best minimizedAffinity of each molecule title in a Smina
+    # output file
+    scores = {}
+    title = None
+    with open(output_name, 'r') as output_file:
+        for line in output_file:
+            if title is None:
+                title = line.strip()
+            elif line.startswith("> <minimizedAffinity>"):
+                score = float(next(output_file))
+                if title not in scores or score < scores[title]:
+                    scores[title] = score
+            elif line.startswith("$$$$"):
+                title = None
+    return scores
+
 
-    logging.info("Beginning log for batch started {}."
-                 .format(DATETIME.replace("_", ":")))
+def read_best_scores(test_compound):
+    output_name = os.path.join(OUTPUT_DIR,
+                               compound_name(test_compound) + "_output.sdf")
+    try:
+        return output_name, read_docking_scores(output_name)
+    except FileNotFoundError:
+        logging.warning("No Smina output for {}.".format(test_compound))
+        return output_name, {}
+
+
+def record_result(result_store, test_compound, exit_status, wall_time,
+                  timings=None, usage=None):
+    if result_store is None:
+        return
+    with timed(timings, "parse"):
+        output_name, scores = read_best_scores(test_compound)
+    result_store.add("smina", compound_name(test_compound),
+                     os.path.abspath(test_compound), wall_time, exit_status,
+                     score=min(scores.values(), default=None),
+                     output_path=os.path.abspath(output_name), usage=usage)
+
+
+def record_chunk_scores(chunk_path, chunk_map, scores_name, result_store,
+                        exit_status, wall_time, timings=None, usage=None):
+    # Maps a docked chunk's scores back to library index and name, then
+    # removes the chunk file
+    with timed(timings, "parse"):
+        output_name, scores = read_best_scores(chunk_path)
+    chunk_hash = file_hash(chunk_path)
+
+    with open(scores_name, 'a') as scores_file:
+        for index, name in chunk_map.pop(chunk_path):
+            score = scores.get(str(index))
+            scores_file.write("{}\t{}\t{}\n"
+                              .format(index, name, "" if score is None else score))
+            if result_store is not None:
+                result_store.add("smina", "{}:{}".format(index, name),
+                                 os.path.abspath(SDF_LIBRARY), wall_time,
+                                 exit_status, score=score,
+                                 output_path=os.path.abspath(output_name),
+                                 input_hash=chunk_hash, usage=usage)
+    os.remove(chunk_path)
+
+
+def main():
+    batch_time = start_batch_log()
 
     # Set up input data files
     protein = "REC.pdb"
     ligand = "LIG.sdf"
 
-    if not TEST:
-        test_compounds = ["compound_1.sdf",
-                          "compound_2.sdf",
-                          "compound_3.sdf",
-                          "compound_4.sdf",
-                          "compound_5.sdf",
-                          "compound_6.sdf",
-                          "compound_7.sdf",
-                          "compound_8.sdf",
-                          "compound_9.sdf",
-                          "compound_10.sdf"]
+    os.makedirs(OUTPUT_DIR, exist_ok=True)
+    docked_names = find_docked_names(OUTPUT_DIR)
+
+    journal = None
+    if JOURNAL_FILE:
+        # Output left by compounds that were interrupted is incomplete
+        journal = JobJournal(JOURNAL_FILE)
+        interrupted = journal.jobs_in_state(QUEUED, RUNNING)
+        docked_names = (docked_names - interrupted) | journal.jobs_in_state(DONE)
+
+    result_store = None
+    if RESULTS_DATABASE:
+        result_store = ResultStore(RESULTS_DATABASE, batch_time)
+
+    metrics = None
+    if METRICS_FILE or PROMETHEUS_FILE:
+        metrics = BatchMetrics(METRICS_FILE, PROMETHEUS_FILE, batch_time)
+
+    if SDF_LIBRARY:
+        chunk_dir = tempfile.mkdtemp(prefix="smina_chunks_")
+        chunk_map = {}
+        scores_name = os.path.join(OUTPUT_DIR, compound_name(SDF_LIBRARY)
+                                   + "_scores.tsv")
+        test_compounds = chunk_sdf_library(SDF_LIBRARY, CHUNK_SIZE, chunk_dir,
+                                           chunk_map, docked_names)
+
+        def on_complete(job):
+            record_chunk_scores(job["input_file"], chunk_map, scores_name,
+                                result_store, job["exit_status"],
+                                job["wall_time"], job["timings"], job["usage"])
+            record_docked(journal, job["input_file"], job["exit_status"],
+                          job["wall_time"])
     else:
-        test_compounds = ["compound_1.sdf"]
+        test_compounds = find_ligands(LIGAND_DIR, LIGAND_PATTERN, RECURSIVE,
+                                      docked_names)
+
+        def on_complete(job):
+            record_result(result_store, job["input_file"], job["exit_status"],
+                          job["wall_time"], job["timings"], job["usage"])
+            record_docked(journal, job["input_file"], job["exit_status"],
+                          job["wall_time"])
+    if TEST:
+        test_compounds = itertools.islice(test_compounds, 1)
+    if journal is not None:
+        test_compounds = journaled(test_compounds, journal)
     logging.info("Protein file: {}".format(protein))
     logging.info("Ligand file: {}".format(ligand))
-    logging.info("Number of test compounds: {}".format(len(test_compounds)))
-
-    # Run each test compound
-    for compound in test_compounds:
-        logging.info("Beginning Smina job for {}.".format(compound))
-
-        start_time = time.time()
-        process_data(compound, protein, ligand)
-        end_time = time.time()
+    if SDF_LIBRARY:
+        logging.info("Docking {} in chunks of {}."
+                     .format(SDF_LIBRARY, CHUNK_SIZE))
+    else:
+        logging.info("Searching {} for {}.".format(LIGAND_DIR, LIGAND_PATTERN))
+    logging.info("Number of compounds already docked: {}"
+                 .format(len(docked_names)))
 
-        logging.info("Smina job for {} complete.".format(compound))
-        logging.info("Run time: {} seconds.".format((end_time - start_time)))
+    # Run each test compound, each worker pinned to its own share of the
+    # available cores
+    cores = available_cores()
+    workers = max(1, min(WORKERS, len(cores)))
+    logging.info("Running {} Smina workers.".format(workers))
+    runner = SminaRunner(SMINA_EXECUTABLE, protein, ligand, OUTPUT_DIR)
+    try:
+        run_batch(runner, test_compounds, cores, len(cores) // workers, 0,
+                  on_complete, metrics=metrics, max_jobs=workers)
+    finally:
+        if SDF_LIBRARY:
+            shutil.rmtree(chunk_dir, ignore_errors=True)
+        if result_store is not None:
+            result_store.close()
+        if journal is not None:
+            journal.close()
+        if metrics is not None:
+            metrics.close()
 
     logging.info("Batch process complete.")
 
 
-main()
+if __name__ == "__main__":
+    main()